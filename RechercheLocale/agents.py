@@ -0,0 +1,15 @@
+import metaheuristics
+import random_solver
+import solver
+"""
+    Registry of the solving strategies, for the scripts running several of them (benchmark.py, batch.py).
+"""
+
+# strategies called as strategy(problem, seed, time_limit, callback), callback(elapsed, cost, solution)
+STRATEGIES = {
+    "random": lambda problem, seed, time_limit, callback: random_solver.solve(problem),
+    "advanced": lambda problem, seed, time_limit, callback: solver.solve(problem, seed=seed, time_limit=time_limit, callback=callback),
+    "annealing": lambda problem, seed, time_limit, callback: metaheuristics.simulated_annealing(problem, seed=seed, time_limit=time_limit, callback=callback),
+    "tabu": lambda problem, seed, time_limit, callback: metaheuristics.tabu_search(problem, seed=seed, time_limit=time_limit, callback=callback),
+    "genetic": lambda problem, seed, time_limit, callback: metaheuristics.genetic_algorithm(problem, seed=seed, time_limit=time_limit, callback=callback),
+}
@@ -0,0 +1,151 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from agents import STRATEGIES
+from instance_io import _atomic_write, load_instance_arrays
+from uflp import UFLP
+"""
+    Batch solving of many instances files on a pool of worker processes.
+
+    Every result is cached in the cache folder under a key made of the hash of the content of the instance file
+    and of the solver configuration (agent, seed, time limit, sparse_k), so unchanged instances are not solved
+    again on the next runs. All the results are written in a single JSON file. An instance that fails (unreadable
+    file, error of the solver) gets an entry with its "error" instead of a result, which is not cached, and the
+    other instances are still solved.
+
+    Example : python batch.py "instances/*.txt" --agent advanced --time-limit 30 --workers 8 --output results.json
+"""
+
+def instance_hash(filename: str) -> str:
+    """SHA-256 of the content of an instance file"""
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def cache_key(content_hash: str, config: dict) -> str:
+    """Key of a result : hash of the instance content and of the solver configuration"""
+    return hashlib.sha256((content_hash + json.dumps(config, sort_keys=True)).encode()).hexdigest()
+
+def list_instances(patterns) -> list:
+    """Instances files matching glob patterns or inside folders (*.txt), sorted and without duplicates"""
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*.txt")
+        files.extend(glob.glob(pattern))
+    return sorted(set(files))
+
+def solve_instance(filename: str, config: dict) -> dict:
+    """Solve one instance file (run in a worker process)
+
+    Returns:
+        dict: instance, cost, opened stations, association, time (seconds, loading included) and configuration
+    """
+    start_time = time.perf_counter()
+    opening_cost, main_coordinates, satellite_coordinates = load_instance_arrays(filename)
+    name = os.path.splitext(os.path.basename(filename))[0]
+    problem = UFLP.from_arrays(name, opening_cost, main_coordinates, satellite_coordinates, sparse_k=config["sparse_k"])
+    main_stations_opened, satellite_station_association = STRATEGIES[config["agent"]](problem, config["seed"], config["time_limit"], None)
+    return {
+        "instance": filename,
+        "cost": problem.calculate_cost(main_stations_opened, satellite_station_association),
+        "feasible": problem.solution_checker(main_stations_opened, satellite_station_association),
+        "main_stations_opened": [int(v) for v in main_stations_opened],
+        "satellite_station_association": [int(v) for v in satellite_station_association],
+        "time": time.perf_counter() - start_time,
+        "seed": config["seed"],
+        "config": config,
+    }
+
+def _error_entry(filename: str, error: Exception, content_hash, config: dict) -> dict:
+    """Entry of an instance that could not be solved (never cached)"""
+    return {"instance": filename, "error": "%s: %s" % (type(error).__name__, error), "content_hash": content_hash,
+            "cached": False, "config": config}
+
+def run_batch(files, config: dict, n_workers=None, cache_dir=".batch_cache", force=False, verbose=True) -> list:
+    """Solve many instances files concurrently, reusing the cached results
+
+    Args:
+        files (List[str]): instances files
+        config (dict): solver configuration : agent, seed, time_limit, sparse_k
+        n_workers (int): number of worker processes (None for the number of CPUs)
+        cache_dir (str): folder of the cached results (None to disable the cache)
+        force (bool): solve again the instances already in the cache
+
+    Returns:
+        List[dict]: results (see solve_instance) in the order of the files, with "content_hash" and "cached".
+            The entry of a failed instance has its "instance", "error", "content_hash", "cached" and "config"
+    """
+    results = {}
+    to_solve = {}
+    for filename in files:
+        try:
+            content_hash = instance_hash(filename)
+        except OSError as e:
+            results[filename] = _error_entry(filename, e, None, config)
+            continue
+        cache_path = os.path.join(cache_dir, cache_key(content_hash, config) + ".json") if cache_dir else None
+        if cache_path and not force and os.path.exists(cache_path):
+            with open(cache_path) as f:
+                result = json.load(f)
+            result.update(instance=filename, content_hash=content_hash, cached=True)
+            results[filename] = result
+        else:
+            to_solve[filename] = (content_hash, cache_path)
+    if verbose:
+        print("[INFO] %d instances, %d cached, %d to solve" % (len(files), sum(result["cached"] for result in results.values()), len(to_solve)))
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    if to_solve:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = {executor.submit(solve_instance, filename, config): filename for filename in to_solve}
+            for future in as_completed(futures):
+                filename = futures[future]
+                content_hash, cache_path = to_solve[filename]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # the error is reported but not cached, the instance is solved again on the next run
+                    results[filename] = _error_entry(filename, e, content_hash, config)
+                    if verbose:
+                        print("[ERROR] %s: %s" % (filename, results[filename]["error"]))
+                    continue
+                result.update(content_hash=content_hash, cached=False)
+                if cache_path:
+                    _atomic_write(cache_path, lambda f: f.write(json.dumps(result).encode()))
+                results[filename] = result
+                if verbose:
+                    print("[INFO] %s: cost %s in %.2f s" % (filename, result["cost"], result["time"]))
+    return [results[filename] for filename in files]
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    # folders or glob patterns of instances files
+    parser.add_argument('instances', nargs='+')
+    parser.add_argument('--agent', type=str, default='advanced', choices=sorted(STRATEGIES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--time-limit', type=float, default=None)
+    parser.add_argument('--sparse-k', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument('--cache-dir', type=str, default='.batch_cache')
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--force', action='store_true')
+    parser.add_argument('--output', type=str, default='results.json')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    files = list_instances(args.instances)
+    config = {"agent": args.agent, "seed": args.seed, "time_limit": args.time_limit, "sparse_k": args.sparse_k}
+    start_time = time.time()
+    results = run_batch(files, config, n_workers=args.workers or None, cache_dir=None if args.no_cache else args.cache_dir, force=args.force)
+    _atomic_write(args.output, lambda f: f.write(json.dumps(results).encode()), ignore_errors=False)
+    n_errors = sum("error" in result for result in results)
+    print("[INFO] %d results (%d errors) written to %s in %.2f s" % (len(results), n_errors, args.output, time.time() - start_time))
@@ -0,0 +1,159 @@
+import argparse
+import csv
+import json
+import os
+import time
+import tracemalloc
+
+from agents import STRATEGIES
+from evaluator import IncrementalEvaluator
+from instance_generator import COST_DISTRIBUTIONS, generate_instance
+from uflp import UFLP
+"""
+    Benchmark of the solvers on a sweep of synthetic instances (see instance_generator.py).
+
+    For every size, instance seed and strategy, reports the wall time, the number of cost evaluations (solutions
+    evaluated by calculate_cost or calculate_costs plus moves evaluated incrementally) per second, the best cost
+    over time and, with --memory, the peak memory allocated during the solve (tracemalloc, which slows the run down).
+
+    Example : python benchmark.py --sizes 50x75,200x400,1000x2000 --strategies advanced,annealing,tabu --time-limit 10
+"""
+
+CSV_FIELDS = ["instance", "n_main_station", "n_satellite_station", "cost_distribution", "instance_seed", "strategy", "seed",
+              "load_time", "solve_time", "cost", "feasible", "evaluations", "evaluations_per_second", "peak_memory_mb"]
+
+def run_strategy(problem: UFLP, strategy: str, seed=None, time_limit=None, measure_memory=False) -> dict:
+    """Solve an instance with a strategy and measure the run
+
+    Returns:
+        dict: the CSV_FIELDS of the run related to the solve, and "trajectory", the list of (elapsed, best cost)
+    """
+    trajectory = []
+    calls = [0]
+    calculate_cost = problem.calculate_cost
+    calculate_costs = problem.calculate_costs
+    def counted_calculate_cost(*args):
+        calls[0] += 1
+        return calculate_cost(*args)
+    def counted_calculate_costs(population, *args):
+        calls[0] += len(population)
+        return calculate_costs(population, *args)
+    def callback(elapsed, cost, solution):
+        trajectory.append((elapsed, cost))
+
+    problem.calculate_cost = counted_calculate_cost
+    problem.calculate_costs = counted_calculate_costs
+    evaluations_before = IncrementalEvaluator.n_evaluations
+    if measure_memory:
+        tracemalloc.start()
+    start_time = time.perf_counter()
+    try:
+        main_stations_opened, satellite_station_association = STRATEGIES[strategy](problem, seed, time_limit, callback)
+        solve_time = time.perf_counter() - start_time
+    finally:
+        peak_memory = tracemalloc.get_traced_memory()[1] if measure_memory else None
+        if measure_memory:
+            tracemalloc.stop()
+        del problem.calculate_cost
+        del problem.calculate_costs
+    evaluations = calls[0] + IncrementalEvaluator.n_evaluations - evaluations_before
+    cost = problem.calculate_cost(main_stations_opened, satellite_station_association)
+    if not trajectory or trajectory[-1][1] != cost:
+        trajectory.append((solve_time, cost))
+    return {
+        "strategy": strategy,
+        "seed": seed,
+        "solve_time": solve_time,
+        "cost": cost,
+        "feasible": problem.solution_checker(main_stations_opened, satellite_station_association),
+        "evaluations": evaluations,
+        "evaluations_per_second": evaluations / solve_time if solve_time > 0 else None,
+        "peak_memory_mb": peak_memory / 2**20 if peak_memory is not None else None,
+        "trajectory": trajectory,
+    }
+
+def run_benchmark(sizes, strategies, instance_seeds=(0,), seed=0, cost_distribution="uniform", time_limit=None,
+                  measure_memory=False, folder="instances/generated", sparse_k=None, verbose=True):
+    """Run every strategy on a sweep of generated instances
+
+    Args:
+        sizes (List[Tuple[int, int]]): (n_main_station, n_satellite_station) of the instances
+        strategies (List[str]): names of the strategies (keys of STRATEGIES)
+        instance_seeds (List[int]): seeds of the generated instances, one instance per size and seed
+        seed (int): seed of the strategies
+        cost_distribution (str): distribution of the opening costs of the generated instances
+        time_limit (float): time limit given to the strategies that accept one
+        measure_memory (bool): measure the peak memory with tracemalloc
+        folder (str): folder of the generated instances, relative to the current folder (generated once, then reused)
+        sparse_k (int): load the instances with the sparse cost model
+
+    Returns:
+        List[dict]: one result per run (CSV_FIELDS and trajectory)
+    """
+    results = []
+    for n_main_station, n_satellite_station in sizes:
+        for instance_seed in instance_seeds:
+            name = "instance_%s_%d_%d_s%d" % (cost_distribution, n_main_station, n_satellite_station, instance_seed)
+            filename = os.path.join(folder, name + ".txt")
+            if not os.path.exists(filename):
+                generate_instance(filename, n_main_station, n_satellite_station, instance_seed, cost_distribution)
+            start_time = time.perf_counter()
+            # UFLP loads instances relatively to the instances folder
+            problem = UFLP(os.path.relpath(os.path.join(folder, name), "instances"), sparse_k=sparse_k)
+            load_time = time.perf_counter() - start_time
+            for strategy in strategies:
+                result = {
+                    "instance": name,
+                    "n_main_station": n_main_station,
+                    "n_satellite_station": n_satellite_station,
+                    "cost_distribution": cost_distribution,
+                    "instance_seed": instance_seed,
+                    "load_time": load_time,
+                }
+                result.update(run_strategy(problem, strategy, seed, time_limit, measure_memory))
+                results.append(result)
+                if verbose:
+                    print("[INFO] %s %s: cost %.4f in %.3f s, %.0f evaluations/s" % (name, strategy, result["cost"],
+                          result["solve_time"], result["evaluations_per_second"] or 0))
+    return results
+
+def write_csv(results, filename: str) -> None:
+    with open(filename, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(results)
+
+def write_json(results, filename: str) -> None:
+    with open(filename, "w") as f:
+        json.dump(results, f, indent=1)
+
+def parse_sizes(sizes: str):
+    """"50x75,200x400" -> [(50, 75), (200, 400)]"""
+    return [tuple(int(n) for n in size.split("x")) for size in sizes.split(",")]
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=str, default='50x75,200x400,1000x2000')
+    parser.add_argument('--strategies', type=str, default='random,advanced')
+    parser.add_argument('--instance-seeds', type=str, default='0')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--costs', type=str, default='uniform', choices=COST_DISTRIBUTIONS)
+    parser.add_argument('--time-limit', type=float, default=None)
+    parser.add_argument('--sparse-k', type=int, default=None)
+    parser.add_argument('--memory', action='store_true')
+    parser.add_argument('--csv', type=str, default='benchmark.csv')
+    # the JSON file also holds the best cost over time of each run
+    parser.add_argument('--json', type=str, default='benchmark.json')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    strategies = args.strategies.split(",")
+    for strategy in strategies:
+        if strategy not in STRATEGIES:
+            raise Exception("This agent does not exist: %s" % strategy)
+    results = run_benchmark(parse_sizes(args.sizes), strategies, [int(s) for s in args.instance_seeds.split(",")], args.seed,
+                            args.costs, args.time_limit, args.memory, sparse_k=args.sparse_k)
+    write_csv(results, args.csv)
+    write_json(results, args.json)
+    print("[INFO] results written: %s, %s" % (args.csv, args.json))
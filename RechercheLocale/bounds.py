@@ -0,0 +1,134 @@
+from uflp import UFLP
+import math
+import time
+import numpy as np
+"""
+    Lower bound of the UFLP by Lagrangian relaxation of the assignment constraints, with subgradient updates.
+
+    With a multiplier lambda_j per satellite station, the relaxation decomposes by main station :
+    L(lambda) = sum_j lambda_j + sum_i min(0, rho_i) with the reduced cost rho_i = f_i + sum_j min(0, c_ij - lambda_j),
+    and L(lambda) is a lower bound of the cost of every solution. The reduced costs also allow to fix stations :
+    forcing a station to the state opposite to the relaxation raises the bound by |rho_i|, if that exceeds the best
+    known cost the station keeps its state in every better solution.
+"""
+
+class LagrangianBound():
+    """Result of lagrangian_bound"""
+
+    def __init__(self, lower_bound: float, relaxation_value: float, multipliers: np.ndarray, reduced_costs: np.ndarray,
+                 upper_bound: float, solution, n_iterations: int) -> None:
+        """
+        Args:
+            lower_bound (float): best lower bound found (the relaxation opens at least one station)
+            relaxation_value (float): value of the relaxation without that constraint, for the same multipliers
+            multipliers (np.ndarray): multipliers of the best lower bound
+            reduced_costs (np.ndarray): reduced costs rho_i of the main stations for these multipliers
+            upper_bound (float): best known cost (given or found by the primal heuristic)
+            solution (Tuple[List[int], List[int]]): solution of upper_bound found by the primal heuristic, None if not improved
+            n_iterations (int): number of subgradient iterations done
+        """
+        self.lower_bound = lower_bound
+        self.relaxation_value = relaxation_value
+        self.multipliers = multipliers
+        self.reduced_costs = reduced_costs
+        self.upper_bound = upper_bound
+        self.solution = solution
+        self.n_iterations = n_iterations
+
+    def gap(self, cost=None) -> float:
+        """Relative gap (cost - lower_bound) / cost, with the upper bound by default"""
+        return optimality_gap(self.upper_bound if cost is None else cost, self.lower_bound)
+
+    def fixed_stations(self, upper_bound=None):
+        """Main stations whose state is the same in every solution cheaper than the upper bound
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: bool vectors of the stations fixed opened and of the stations fixed closed
+        """
+        upper_bound = self.upper_bound if upper_bound is None else upper_bound
+        margin = 1e-9 * max(1.0, abs(upper_bound))
+        # forcing the opposite state of the relaxation raises its value by |rho_i|
+        raised = self.relaxation_value + np.abs(self.reduced_costs) > upper_bound + margin
+        fixed_open = raised & (self.reduced_costs < 0)
+        fixed_closed = raised & (self.reduced_costs >= 0)
+        if fixed_closed.all():
+            fixed_closed[:] = False
+        return fixed_open, fixed_closed
+
+def optimality_gap(cost: float, lower_bound: float) -> float:
+    """Relative gap between a cost and a lower bound (0 when the cost is proven optimal)"""
+    if cost == lower_bound:
+        return 0.0
+    if not math.isfinite(cost) or cost <= 0:
+        return math.inf
+    return max(0.0, (cost - lower_bound) / cost)
+
+def lagrangian_bound(problem: UFLP, upper_bound=math.inf, n_iterations=300, step=2.0, min_step=1e-4, patience=10,
+                     gap_tolerance=0.0, deadline=None) -> LagrangianBound:
+    """Lagrangian lower bound computed with subgradient updates (needs the dense distance matrix)
+
+    Args:
+        problem (UFLP): instance of the problem
+        upper_bound (float): best known cost, used for the step size and to stop at gap_tolerance
+        n_iterations (int): maximum number of subgradient iterations
+        step (float): initial step factor, halved after patience iterations without improvement
+        min_step (float): the updates stop when the step factor falls below it
+        patience (int): number of iterations without improvement of the bound before halving the step
+        gap_tolerance (float): stop when the gap with the upper bound falls below it
+        deadline (float): time.time() at which the updates stop
+
+    Returns:
+        LagrangianBound: bound, multipliers, reduced costs and best solution of the primal heuristic
+    """
+    cost_matrix = problem.connection_cost_matrix
+    if cost_matrix is None:
+        raise ValueError("The Lagrangian bound needs the dense distance matrix (instance loaded without sparse_k)")
+    opening_cost = problem.main_stations_opening_cost_array
+    # start from the second nearest distance : every satellite station is attracted by at least two stations
+    if problem.n_main_station > 1:
+        multipliers = np.partition(cost_matrix, 1, axis=0)[1].copy()
+    else:
+        multipliers = cost_matrix[0].copy()
+    best = (-math.inf, -math.inf, multipliers.copy(), opening_cost.copy())
+    best_solution = None
+    seen_openings = set()
+    no_improvement = 0
+    iteration = 0
+    for iteration in range(1, n_iterations + 1):
+        reduced_costs = opening_cost + np.minimum(cost_matrix - multipliers, 0.0).sum(axis=1)
+        opened = reduced_costs < 0
+        relaxation_value = float(multipliers.sum() + reduced_costs[opened].sum())
+        if not opened.any():
+            # every solution opens a station
+            opened[np.argmin(reduced_costs)] = True
+        value = float(multipliers.sum() + reduced_costs[opened].sum())
+        if value > best[0] + 1e-12 * max(1.0, abs(value)):
+            best = (value, relaxation_value, multipliers.copy(), reduced_costs)
+            no_improvement = 0
+        else:
+            no_improvement += 1
+            if no_improvement >= patience:
+                step /= 2
+                no_improvement = 0
+        # primal heuristic : open the stations of the relaxation, assign to the nearest
+        key = opened.tobytes()
+        if key not in seen_openings:
+            seen_openings.add(key)
+            cost = float(opening_cost[opened].sum() + cost_matrix[opened].min(axis=0).sum())
+            if cost < upper_bound:
+                upper_bound = cost
+                best_solution = (opened.astype(np.int32).tolist(), np.flatnonzero(opened)[np.argmin(cost_matrix[opened], axis=0)].tolist())
+        if optimality_gap(upper_bound, best[0]) <= gap_tolerance or step < min_step:
+            break
+        if deadline is not None and time.time() >= deadline:
+            break
+        # subgradient of the relaxed constraints sum_i x_ij = 1
+        subgradient = 1.0 - ((cost_matrix < multipliers) & opened[:, np.newaxis]).sum(axis=0)
+        norm = float(subgradient @ subgradient)
+        if norm == 0:
+            # the relaxed solution is feasible : the bound is optimal
+            break
+        target = upper_bound if math.isfinite(upper_bound) else 1.05 * abs(value) + 1.0
+        multipliers += step * (target - value) / norm * subgradient
+    lower_bound, relaxation_value, multipliers, reduced_costs = best
+    return LagrangianBound(lower_bound, relaxation_value, multipliers, reduced_costs, upper_bound, best_solution, iteration)
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import time
+import numpy as np
+"""
+    Checkpoints of long searches, to resume them after an interruption (e.g. a preempted job).
+
+    A checkpoint is a single .npz file : the arrays of the state (best solution, tabu list...) in binary form and a
+    JSON header holding the configuration of the run and the scalars of the state (counters, costs, state of the
+    random generator). It is written to a temporary file then renamed, so an interruption during a write leaves
+    the previous checkpoint intact. A resumed run checks that the configuration is the same as the saved one,
+    including a digest of the content of the instance (see instance_digest).
+"""
+
+class Checkpoint():
+    """Periodic checkpoints of a search in a file"""
+
+    def __init__(self, path: str, interval: float = 5.0, resume: bool = False) -> None:
+        """
+        Args:
+            path (str): checkpoint file (.npz)
+            interval (float): minimum number of seconds between two periodic saves
+            resume (bool): resume the run saved in the file if it exists, otherwise the file is overwritten
+        """
+        self.path = path
+        self.interval = interval
+        self.resume = resume
+        self.last_save = time.time()
+
+    def due(self) -> bool:
+        """True when the last save is older than the interval"""
+        return time.time() - self.last_save >= self.interval
+
+    def save(self, config: dict, state: dict) -> None:
+        """Write a checkpoint atomically
+
+        Args:
+            config (dict): configuration of the run (JSON), compared when the checkpoint is loaded
+            state (dict): state of the search, np.ndarray values are stored in binary, the others in JSON
+        """
+        arrays = {name: value for name, value in state.items() if isinstance(value, np.ndarray)}
+        header = {"config": config, "state": {name: value for name, value in state.items() if name not in arrays}}
+        arrays["header"] = np.frombuffer(json.dumps(header).encode(), dtype=np.uint8)
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, self.path)
+        self.last_save = time.time()
+
+    def restore(self, config: dict):
+        """Read the checkpoint of a run to resume
+
+        Args:
+            config (dict): configuration of the run, must be the one of the checkpoint
+
+        Returns:
+            dict: saved state (arrays and scalars), None if there is no checkpoint or resume is False
+        """
+        if not self.resume or not os.path.exists(self.path):
+            return None
+        with np.load(self.path) as data:
+            header = json.loads(data["header"].tobytes().decode())
+            state = {name: data[name] for name in data.files if name != "header"}
+        # same JSON round trip as the saved configuration (tuples become lists...)
+        if header["config"] != json.loads(json.dumps(config)):
+            raise ValueError("The checkpoint %s was written by another run: %s" % (self.path, header["config"]))
+        state.update(header["state"])
+        return state
+
+def solution_state(cost: float, solution) -> dict:
+    """State entries of a solution : cost, bit-packed opened main stations and int32 association"""
+    return {"cost": float(cost), "main_stations_opened": np.packbits(np.asarray(solution[0]).astype(bool)),
+            "satellite_station_association": np.asarray(solution[1], dtype=np.int32)}
+
+def state_solution(state: dict, n_main_station: int):
+    """(cost, solution) saved by solution_state, the solution in the format of the UFLP class"""
+    main_stations_opened = np.unpackbits(state["main_stations_opened"], count=n_main_station).astype(np.int32)
+    return state["cost"], (main_stations_opened.tolist(), state["satellite_station_association"].tolist())
+
+def instance_digest(problem) -> str:
+    """Digest of the content of an instance for the configuration of a run : opening costs, coordinates and the
+    connection costs when they are not derived from the coordinates (a checkpoint is not resumed on a modified
+    instance with the same name and sizes)"""
+    digest = hashlib.blake2b(digest_size=16)
+    arrays = [problem.main_stations_opening_cost_array, problem.main_stations_coordinates_array,
+              problem.satellite_stations_coordinates_array]
+    if problem.custom_connection_costs:
+        arrays.append(problem.connection_cost_matrix)
+    for array in arrays:
+        digest.update(np.ascontiguousarray(array, dtype=np.float64))
+    return digest.hexdigest()
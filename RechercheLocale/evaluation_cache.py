@@ -0,0 +1,89 @@
+from collections import OrderedDict
+import hashlib
+import numpy as np
+"""
+    Bounded cache of evaluated open-station configurations, shared by the restarts of a process.
+
+    A configuration is keyed by a 16 bytes digest of its packed 0/1 vector of opened main stations. The size of
+    each entry is estimated (key, NumPy arrays of the value and a fixed overhead) and the least recently used
+    entries are evicted once max_size entries or max_bytes bytes are reached.
+"""
+
+# approximate bytes of an entry besides its key and its arrays : node of the dict, tuple of the value and its scalars
+ENTRY_OVERHEAD = 200
+
+class EvaluationCache():
+    """LRU cache : key of a configuration (see key) -> value, with hit/miss statistics"""
+
+    def __init__(self, max_size: int = 1 << 16, max_bytes: int = 1 << 26) -> None:
+        """
+        Args:
+            max_size (int): maximum number of entries
+            max_bytes (int): maximum estimated size of the entries in bytes (None for no limit)
+        """
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(main_stations_opened) -> bytes:
+        """Compact key of a configuration : digest of the bit-packed vector of the opened main stations"""
+        packed = np.packbits(np.asarray(main_stations_opened).astype(bool))
+        return hashlib.blake2b(packed.tobytes(), digest_size=16).digest()
+
+    def get(self, key: bytes, default=None):
+        """Value of a configuration (default if not cached), counted as a hit or a miss"""
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def peek(self, key: bytes, default=None):
+        """Value of a configuration without updating the statistics nor the eviction order"""
+        return self.entries.get(key, default)
+
+    @staticmethod
+    def entry_bytes(key: bytes, value) -> int:
+        """Estimated size of an entry : its key, the NumPy arrays of the value (a tuple or an array) and ENTRY_OVERHEAD"""
+        values = value if isinstance(value, tuple) else (value,)
+        return ENTRY_OVERHEAD + len(key) + sum(v.nbytes for v in values if isinstance(v, np.ndarray))
+
+    def put(self, key: bytes, value) -> None:
+        """Store the value of a configuration, evicting the least recently used entries if the cache is full"""
+        previous = self.entries.get(key)
+        if previous is not None:
+            self.nbytes -= self.entry_bytes(key, previous)
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        self.nbytes += self.entry_bytes(key, value)
+        while self.entries and (len(self.entries) > self.max_size or (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+            old_key, old_value = self.entries.popitem(last=False)
+            self.nbytes -= self.entry_bytes(old_key, old_value)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """Remove every entry and reset the statistics"""
+        self.entries.clear()
+        self.nbytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def stats(self) -> dict:
+        """Statistics of the cache
+
+        Returns:
+            dict: hits, misses, hit_rate, evictions, size, max_size, bytes and max_bytes
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions, "size": len(self.entries), "max_size": self.max_size,
+                "bytes": self.nbytes, "max_bytes": self.max_bytes}
@@ -0,0 +1,438 @@
+from uflp import UFLP
+import math
+import numpy as np
+
+class IncrementalEvaluator():
+    """Incremental evaluation of open/close moves for the UFLP.
+
+    For every satellite station the evaluator keeps its nearest and second nearest opened main station
+    (and the matching connection costs). This gives the exact cost variation of opening or closing a
+    single main station in O(n_sat), and the state is updated in place when a move is applied.
+    """
+
+    # number of moves evaluated by all the evaluators (used by the benchmark)
+    n_evaluations = 0
+
+    def __init__(self, problem: UFLP, main_stations_opened, frozen=None) -> None:
+        """
+        Args:
+            problem (UFLP): instance of the problem
+            main_stations_opened (List[int] | np.ndarray): 0/1 vector of the opened main stations, at least one must be opened
+            frozen (np.ndarray): bool vector of the main stations that must keep their state (their moves have an infinite delta)
+        """
+        self.problem = problem
+        self.frozen = None if frozen is None or not np.any(frozen) else np.asarray(frozen, dtype=bool)
+        self.opening_cost = problem.main_stations_opening_cost_array
+        self.cost_matrix = problem.connection_cost_matrix
+        self.opened = np.asarray(main_stations_opened).astype(bool)
+        if not self.opened.any():
+            raise ValueError("At least one main station must be opened")
+        self.n_opened = int(self.opened.sum())
+        # compact state : bool vector of the opened stations and int32 associations
+        self.nearest = np.empty(problem.n_satellite_station, dtype=np.int32)
+        self.second = np.empty(problem.n_satellite_station, dtype=np.int32)
+        self.nearest_cost = np.empty(problem.n_satellite_station, dtype=np.float64)
+        self.second_cost = np.empty(problem.n_satellite_station, dtype=np.float64)
+        self._update_satellites(np.arange(problem.n_satellite_station))
+        self._update_cost()
+
+    def _update_satellites(self, satellites: np.ndarray, chunk_size=2**20) -> None:
+        """Recompute the nearest and second nearest opened main stations of some satellite stations (by chunks of
+        about chunk_size costs)"""
+        satellites_per_chunk = max(1, chunk_size // len(self.opening_cost))
+        for start in range(0, len(satellites), satellites_per_chunk):
+            chunk = satellites[start:start + satellites_per_chunk]
+            costs = np.where(self.opened[:, np.newaxis], self.cost_matrix[:, chunk], np.inf)
+            columns = np.arange(len(chunk))
+            # argmin keeps the lowest index on ties, like assign_nearest_mains
+            nearest = np.argmin(costs, axis=0)
+            self.nearest[chunk] = nearest
+            self.nearest_cost[chunk] = costs[nearest, columns]
+            costs[nearest, columns] = np.inf
+            second = np.argmin(costs, axis=0)
+            second_cost = costs[second, columns]
+            # -1 when only one main station is opened
+            self.second[chunk] = np.where(np.isinf(second_cost), -1, second)
+            self.second_cost[chunk] = second_cost
+
+    def _update_cost(self) -> None:
+        """Recompute the cost of the current solution from the state (avoids the drift of summed deltas)"""
+        self.cost = float(self.opening_cost[self.opened].sum() + self.nearest_cost.sum())
+
+    def open_delta(self, main_station: int) -> float:
+        """Cost variation when opening a closed main station"""
+        IncrementalEvaluator.n_evaluations += 1
+        gain = np.minimum(self.cost_matrix[main_station] - self.nearest_cost, 0.0).sum()
+        return float(self.opening_cost[main_station] + gain)
+
+    def close_delta(self, main_station: int) -> float:
+        """Cost variation when closing an opened main station (inf if it is the last one)"""
+        IncrementalEvaluator.n_evaluations += 1
+        if self.n_opened == 1:
+            return math.inf
+        moved = self.nearest == main_station
+        loss = (self.second_cost[moved] - self.nearest_cost[moved]).sum()
+        return float(loss - self.opening_cost[main_station])
+
+    def delta(self, main_station: int) -> float:
+        """Cost variation when flipping the state of a main station (inf if it is frozen)"""
+        if self.frozen is not None and self.frozen[main_station]:
+            return math.inf
+        if self.opened[main_station]:
+            return self.close_delta(main_station)
+        return self.open_delta(main_station)
+
+    def all_deltas(self) -> np.ndarray:
+        """Cost variation of flipping each main station (whole neighbourhood in one vectorized pass)
+
+        Returns:
+            np.ndarray: delta of the flip of each main station, inf for forbidden moves (frozen stations included)
+        """
+        deltas = self._flip_deltas()
+        if self.frozen is not None:
+            deltas[self.frozen] = np.inf
+        return deltas
+
+    def swap_delta(self, closed_station: int, opened_station: int) -> float:
+        """Cost variation when closing an opened main station and opening a closed one (inf if one is frozen)"""
+        if self.frozen is not None and (self.frozen[closed_station] or self.frozen[opened_station]):
+            return math.inf
+        return self._swap_delta(closed_station, opened_station)
+
+    def swap_deltas(self, closed_station: int) -> np.ndarray:
+        """Cost variation of every swap closing closed_station (one vectorized pass)
+
+        Returns:
+            np.ndarray: delta of the swap with each main station, inf for the opened and frozen ones
+        """
+        if self.frozen is not None and self.frozen[closed_station]:
+            return np.full(len(self.opening_cost), np.inf)
+        deltas = self._swap_deltas(closed_station)
+        if self.frozen is not None:
+            deltas[self.frozen] = np.inf
+        return deltas
+
+    def _flip_deltas(self) -> np.ndarray:
+        """Flip deltas of all the main stations, frozen stations not taken into account"""
+        IncrementalEvaluator.n_evaluations += len(self.opening_cost)
+        gains = self._row_sums(lambda rows, out: np.minimum(np.subtract(rows, self.nearest_cost, out=out), 0.0, out=out))
+        open_deltas = self.opening_cost + gains
+        if self.n_opened == 1:
+            close_deltas = np.full(len(self.opening_cost), np.inf)
+        else:
+            close_deltas = np.bincount(self.nearest, weights=self.second_cost - self.nearest_cost, minlength=len(self.opening_cost)) - self.opening_cost
+        return np.where(self.opened, close_deltas, open_deltas)
+
+    def _swap_delta(self, closed_station: int, opened_station: int) -> float:
+        """Swap delta in O(n_sat), frozen stations not taken into account"""
+        IncrementalEvaluator.n_evaluations += 1
+        # cost of each satellite without closed_station, then with opened_station
+        without = np.where(self.nearest == closed_station, self.second_cost, self.nearest_cost)
+        new_costs = np.minimum(without, self.cost_matrix[opened_station])
+        return float(self.opening_cost[opened_station] - self.opening_cost[closed_station] + (new_costs - self.nearest_cost).sum())
+
+    def _swap_deltas(self, closed_station: int) -> np.ndarray:
+        """Deltas of the swaps closing closed_station (inf for the opened stations), frozen stations not taken into account"""
+        IncrementalEvaluator.n_evaluations += len(self.opening_cost)
+        without = np.where(self.nearest == closed_station, self.second_cost, self.nearest_cost)
+        gains = self._row_sums(lambda rows, out: np.subtract(np.minimum(rows, without, out=out), self.nearest_cost, out=out))
+        deltas = self.opening_cost - self.opening_cost[closed_station] + gains
+        deltas[self.opened] = np.inf
+        return deltas
+
+    def _row_sums(self, transform, block_size=2**20) -> np.ndarray:
+        """Sum of each row of a transform of the distance matrix, computed by blocks of rows
+
+        Args:
+            transform (callable): transform(rows, out) writes the transform of a block of rows of the matrix in out
+                and returns it
+            block_size (int): number of costs per block, the blocks share one buffer (no temporary of the size of the matrix)
+
+        Returns:
+            np.ndarray: sum of each transformed row, shape (n_main_station,)
+        """
+        n_main, n_satellite = self.cost_matrix.shape
+        sums = np.empty(n_main)
+        n_rows = max(1, min(n_main, block_size // max(n_satellite, 1)))
+        buffer = np.empty((n_rows, n_satellite))
+        for start in range(0, n_main, n_rows):
+            rows = self.cost_matrix[start:start + n_rows]
+            transform(rows, buffer[:len(rows)]).sum(axis=1, out=sums[start:start + len(rows)])
+        return sums
+
+    def open(self, main_station: int) -> None:
+        """Open a main station and update the state in place, O(n_sat)"""
+        if self.opened[main_station]:
+            return
+        self.opened[main_station] = True
+        self.n_opened += 1
+        costs = self.cost_matrix[main_station]
+        # ties keep the lowest index, like assign_nearest_mains
+        new_nearest = (costs < self.nearest_cost) | ((costs == self.nearest_cost) & (main_station < self.nearest))
+        new_second = ~new_nearest & ((costs < self.second_cost) | ((costs == self.second_cost) & (main_station < self.second)))
+        self.second[new_nearest] = self.nearest[new_nearest]
+        self.second_cost[new_nearest] = self.nearest_cost[new_nearest]
+        self.nearest[new_nearest] = main_station
+        self.nearest_cost[new_nearest] = costs[new_nearest]
+        self.second[new_second] = main_station
+        self.second_cost[new_second] = costs[new_second]
+        self._update_cost()
+
+    def close(self, main_station: int) -> None:
+        """Close a main station and update the state in place
+
+        Only the satellite stations whose nearest or second nearest station was closed are recomputed.
+        """
+        if not self.opened[main_station]:
+            return
+        if self.n_opened == 1:
+            raise ValueError("The last opened main station cannot be closed")
+        self.opened[main_station] = False
+        self.n_opened -= 1
+        affected = np.flatnonzero((self.nearest == main_station) | (self.second == main_station))
+        self._update_satellites(affected)
+        self._update_cost()
+
+    def flip(self, main_station: int) -> None:
+        """Apply the flip of a main station"""
+        if self.opened[main_station]:
+            self.close(main_station)
+        else:
+            self.open(main_station)
+
+    def swap(self, closed_station: int, opened_station: int) -> None:
+        """Apply the swap of an opened main station with a closed one"""
+        self.open(opened_station)
+        self.close(closed_station)
+
+    def compact_solution(self):
+        """Copy of the current solution in compact form
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: bool vector of the opened main stations and int32 association of the satellite stations
+        """
+        return self.opened.copy(), self.nearest.copy()
+
+    def solution(self):
+        """Current solution in the format of the UFLP class
+
+        Returns:
+            Tuple[List[int], List[int]]: opened main stations (0/1) and association of the satellite stations
+        """
+        return self.opened.astype(np.int32).tolist(), self.nearest.tolist()
+
+class SparseIncrementalEvaluator(IncrementalEvaluator):
+    """Incremental evaluator for an instance built with the sparse cost model (UFLP.build_sparse_cost_model).
+
+    Connection costs are read from the candidate lists of the instance. A satellite station whose nearest (or second
+    nearest) opened station is farther than the radius of its list can be improved by any station, its costs are
+    then computed exactly from the coordinates. When the whole neighbourhood is evaluated, only the main stations
+    closer than its nearest opened one are read (found with the spatial index of the instance), so the work stays
+    bounded by the number of improving connections, or all the costs are computed when most connections would be read
+    (few opened stations). Deltas stay exact, on ties the order of the candidate lists is used.
+    """
+
+    def __init__(self, problem: UFLP, main_stations_opened, frozen=None) -> None:
+        self.radius = problem.candidate_radius
+        super().__init__(problem, main_stations_opened, frozen)
+
+    def _update_satellites(self, satellites: np.ndarray) -> None:
+        """Recompute the nearest and second nearest opened main stations of some satellite stations"""
+        if len(satellites) == 0:
+            return
+        problem = self.problem
+        candidates = problem.candidate_mains[satellites]
+        opened = self.opened[candidates]
+        # both stations in the list : they are the two nearest opened stations
+        covered = opened.sum(axis=1) >= 2
+        rows = np.flatnonzero(covered)
+        first = np.argmax(opened[rows], axis=1)
+        rest = opened[rows].copy()
+        rest[np.arange(len(rows)), first] = False
+        second = np.argmax(rest, axis=1)
+        listed = satellites[rows]
+        self.nearest[listed] = candidates[rows, first]
+        self.nearest_cost[listed] = problem.candidate_costs[listed, first]
+        self.second[listed] = candidates[rows, second]
+        self.second_cost[listed] = problem.candidate_costs[listed, second]
+        # otherwise exact computation over all the opened stations
+        uncovered = satellites[~covered]
+        if len(uncovered) == 0:
+            return
+        opened_stations = np.flatnonzero(self.opened)
+        chunk_size = max(1, 2**22 // len(opened_stations))
+        for start in range(0, len(uncovered), chunk_size):
+            chunk = uncovered[start:start + chunk_size]
+            costs = problem.connection_costs(opened_stations, chunk)
+            columns = np.arange(len(chunk))
+            nearest = np.argmin(costs, axis=0)
+            self.nearest[chunk] = opened_stations[nearest]
+            self.nearest_cost[chunk] = costs[nearest, columns]
+            costs[nearest, columns] = np.inf
+            second = np.argmin(costs, axis=0)
+            second_cost = costs[second, columns]
+            self.second[chunk] = np.where(np.isinf(second_cost), -1, opened_stations[second])
+            self.second_cost[chunk] = second_cost
+
+    def _listed(self, main_station: int):
+        """Reverse list of a main station : satellite stations having it in their list and the costs"""
+        start, end = self.problem.main_candidate_start[main_station], self.problem.main_candidate_start[main_station + 1]
+        return self.problem.main_candidate_satellites[start:end], self.problem.main_candidate_costs[start:end]
+
+    def _gains(self, reference: np.ndarray, main_stations=None) -> np.ndarray:
+        """Sum over the satellite stations of min(cost - reference, 0) for some main stations (all by default)
+
+        Listed costs are used where the reference is within the radius of the list, exact costs elsewhere.
+        """
+        problem = self.problem
+        within = reference <= self.radius
+        outside = np.flatnonzero(~within)
+        if main_stations is None:
+            satellites, costs, mains = problem.main_candidate_satellites, problem.main_candidate_costs, problem.main_candidate_mains
+            gains = np.bincount(mains, weights=np.where(within[satellites], np.minimum(costs - reference[satellites], 0.0), 0.0), minlength=problem.n_main_station)
+            if len(outside):
+                gains += self._outside_gains(reference, outside)
+            return gains
+        gains = np.zeros(len(main_stations))
+        for i, main_station in enumerate(main_stations):
+            satellites, costs = self._listed(main_station)
+            gains[i] = np.where(within[satellites], np.minimum(costs - reference[satellites], 0.0), 0.0).sum()
+        if len(outside):
+            gains += self._exact_gains(reference, outside, main_stations)
+        return gains
+
+    def _outside_gains(self, reference: np.ndarray, outside: np.ndarray, max_fraction=0.1, pair_budget=2**22) -> np.ndarray:
+        """Gains of every main station over satellite stations whose reference is outside their list
+
+        Only the main stations closer than the reference improve such a satellite station, they are found with the
+        spatial index. About k stations lie within the radius of a list, so (reference / radius)^2 x k are expected
+        within the reference : when that is more than max_fraction of all the pairs (e.g. few stations opened, far
+        from most satellite stations), every pair is computed instead.
+        """
+        problem = self.problem
+        n_main = problem.n_main_station
+        with np.errstate(divide='ignore'):
+            expected = np.minimum(problem.candidate_mains.shape[1] * (reference[outside] / self.radius[outside]) ** 2, n_main)
+        if expected.sum() > max_fraction * len(outside) * n_main:
+            return self._exact_gains(reference, outside, np.arange(n_main))
+        gains = np.zeros(n_main)
+        # chunks of about pair_budget expected pairs
+        bounds = np.searchsorted(np.cumsum(expected), np.arange(pair_budget, expected.sum(), pair_budget))
+        for chunk in np.split(outside, bounds):
+            coordinates = problem.satellite_stations_coordinates_array[chunk]
+            points, stations = problem.get_spatial_index().stations_within(coordinates, reference[chunk])
+            # same formula as UFLP.coordinates_to_cost_matrix
+            d = coordinates[points] - problem.main_stations_coordinates_array[stations]
+            costs = np.sqrt(d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1])
+            gains += np.bincount(stations, weights=np.minimum(costs - reference[chunk[points]], 0.0), minlength=n_main)
+        return gains
+
+    def _exact_gains(self, reference: np.ndarray, satellites: np.ndarray, main_stations) -> np.ndarray:
+        """Gains of some main stations over some satellite stations, from all the exact costs
+
+        The costs are computed by chunks of satellite stations in two reused buffers, with the formula of
+        UFLP.coordinates_to_cost_matrix.
+        """
+        main_coordinates = self.problem.main_stations_coordinates_array[np.asarray(main_stations)]
+        main_x, main_y = main_coordinates[:, 0, np.newaxis], main_coordinates[:, 1, np.newaxis]
+        gains = np.zeros(len(main_stations))
+        chunk_size = max(1, min(2**20 // len(main_stations), len(satellites)))
+        dx_buffer, dy_buffer = np.empty((len(main_stations), chunk_size)), np.empty((len(main_stations), chunk_size))
+        for start in range(0, len(satellites), chunk_size):
+            chunk = satellites[start:start + chunk_size]
+            coordinates = self.problem.satellite_stations_coordinates_array[chunk]
+            dx, dy = dx_buffer[:, :len(chunk)], dy_buffer[:, :len(chunk)]
+            np.subtract(coordinates[np.newaxis, :, 0], main_x, out=dx)
+            np.subtract(coordinates[np.newaxis, :, 1], main_y, out=dy)
+            np.multiply(dx, dx, out=dx)
+            np.multiply(dy, dy, out=dy)
+            np.add(dx, dy, out=dx)
+            np.sqrt(dx, out=dx)
+            np.subtract(dx, reference[chunk], out=dx)
+            np.minimum(dx, 0.0, out=dx)
+            gains += dx.sum(axis=1)
+        return gains
+
+    def open_delta(self, main_station: int) -> float:
+        """Cost variation when opening a closed main station"""
+        IncrementalEvaluator.n_evaluations += 1
+        return float(self.opening_cost[main_station] + self._gains(self.nearest_cost, [main_station])[0])
+
+    def _flip_deltas(self) -> np.ndarray:
+        """Cost variation of flipping each main station
+
+        Returns:
+            np.ndarray: delta of the flip of each main station, inf for forbidden moves
+        """
+        IncrementalEvaluator.n_evaluations += len(self.opening_cost)
+        open_deltas = self.opening_cost + self._gains(self.nearest_cost)
+        if self.n_opened == 1:
+            close_deltas = np.full(len(self.opening_cost), np.inf)
+        else:
+            close_deltas = np.bincount(self.nearest, weights=self.second_cost - self.nearest_cost, minlength=len(self.opening_cost)) - self.opening_cost
+        return np.where(self.opened, close_deltas, open_deltas)
+
+    def _swap_delta(self, closed_station: int, opened_station: int) -> float:
+        """Cost variation when closing an opened main station and opening a closed one"""
+        IncrementalEvaluator.n_evaluations += 1
+        if self.n_opened == 1:
+            return float(self._single_swap_deltas(closed_station, [opened_station])[0])
+        without = np.where(self.nearest == closed_station, self.second_cost, self.nearest_cost)
+        gain = self._gains(without, [opened_station])[0]
+        return float(self.opening_cost[opened_station] - self.opening_cost[closed_station] + (without - self.nearest_cost).sum() + gain)
+
+    def _swap_deltas(self, closed_station: int) -> np.ndarray:
+        """Cost variation of every swap closing closed_station
+
+        Returns:
+            np.ndarray: delta of the swap with each main station, inf for the opened ones
+        """
+        IncrementalEvaluator.n_evaluations += len(self.opening_cost)
+        if self.n_opened == 1:
+            deltas = self._single_swap_deltas(closed_station, np.arange(len(self.opening_cost)))
+        else:
+            without = np.where(self.nearest == closed_station, self.second_cost, self.nearest_cost)
+            deltas = self.opening_cost - self.opening_cost[closed_station] + (without - self.nearest_cost).sum() + self._gains(without)
+        deltas[self.opened] = np.inf
+        return deltas
+
+    def _single_swap_deltas(self, closed_station: int, main_stations) -> np.ndarray:
+        """Swap deltas when closed_station is the only opened station : every satellite station moves to the new one"""
+        main_stations = np.asarray(main_stations)
+        total = np.zeros(len(main_stations))
+        chunk_size = max(1, 2**22 // len(main_stations))
+        for start in range(0, len(self.nearest_cost), chunk_size):
+            total += self.problem.connection_costs(main_stations, np.arange(start, min(start + chunk_size, len(self.nearest_cost)))).sum(axis=1)
+        return self.opening_cost[main_stations] - self.opening_cost[closed_station] + total - self.nearest_cost.sum()
+
+    def open(self, main_station: int) -> None:
+        """Open a main station and update the state in place
+
+        Only the satellite stations listing it and the ones whose second nearest station is outside their list are read.
+        """
+        if self.opened[main_station]:
+            return
+        self.opened[main_station] = True
+        self.n_opened += 1
+        listed, listed_costs = self._listed(main_station)
+        outside = np.flatnonzero(self.second_cost > self.radius)
+        outside = outside[~np.isin(outside, listed)]
+        satellites = np.concatenate((listed, outside))
+        costs = np.concatenate((listed_costs, self.problem.connection_costs([main_station], outside)[0]))
+        nearest, nearest_cost = self.nearest[satellites], self.nearest_cost[satellites]
+        second, second_cost = self.second[satellites], self.second_cost[satellites]
+        new_nearest = (costs < nearest_cost) | ((costs == nearest_cost) & (main_station < nearest))
+        new_second = ~new_nearest & ((costs < second_cost) | ((costs == second_cost) & (main_station < second)))
+        self.second[satellites[new_nearest]] = nearest[new_nearest]
+        self.second_cost[satellites[new_nearest]] = nearest_cost[new_nearest]
+        self.nearest[satellites[new_nearest]] = main_station
+        self.nearest_cost[satellites[new_nearest]] = costs[new_nearest]
+        self.second[satellites[new_second]] = main_station
+        self.second_cost[satellites[new_second]] = costs[new_second]
+        self._update_cost()
+
+def make_evaluator(problem: UFLP, main_stations_opened, frozen=None) -> IncrementalEvaluator:
+    """Incremental evaluator matching the cost model of the instance (dense or sparse)"""
+    if problem.connection_cost_matrix is None:
+        return SparseIncrementalEvaluator(problem, main_stations_opened, frozen)
+    return IncrementalEvaluator(problem, main_stations_opened, frozen)
@@ -0,0 +1,99 @@
+import argparse
+import os
+import numpy as np
+"""
+    Generation of synthetic instances in the format of the instances folder :
+    a line "n_main_station n_satellite_station 0", one line "x y opening_cost" per main station
+    and one line "x y" per satellite station. Coordinates are in [0, 100]^2.
+
+    Example : python instance_generator.py --n-main 500 --n-satellite 2000 --seed 1
+"""
+
+COST_DISTRIBUTIONS = ["uniform", "normal", "lognormal"]
+COORDINATE_DISTRIBUTIONS = ["uniform", "clustered"]
+
+def generate_coordinates(rng: np.random.Generator, n: int, distribution: str = "uniform", n_clusters: int = 10) -> np.ndarray:
+    """Coordinates of n stations in [0, 100]^2
+
+    Args:
+        rng (np.random.Generator): random generator
+        n (int): number of stations
+        distribution (str): "uniform", or "clustered" (gaussian clusters around random centers, like cities)
+        n_clusters (int): number of clusters of the clustered distribution
+
+    Returns:
+        np.ndarray: array of shape (n, 2)
+    """
+    if distribution == "uniform":
+        return rng.uniform(0, 100, size=(n, 2))
+    if distribution == "clustered":
+        centers = rng.uniform(10, 90, size=(n_clusters, 2))
+        spreads = rng.uniform(2, 10, size=n_clusters)
+        cluster = rng.integers(n_clusters, size=n)
+        return np.clip(centers[cluster] + rng.normal(size=(n, 2)) * spreads[cluster, np.newaxis], 0, 100)
+    raise ValueError("Unknown coordinate distribution: %s" % distribution)
+
+def generate_opening_costs(rng: np.random.Generator, n: int, mean: float, distribution: str = "uniform") -> np.ndarray:
+    """Opening costs of n main stations
+
+    Args:
+        rng (np.random.Generator): random generator
+        n (int): number of main stations
+        mean (float): mean opening cost
+        distribution (str): "uniform" (in [0.5, 1.5] * mean), "normal" (standard deviation mean / 4, at least mean / 10)
+            or "lognormal" (heavy tail, sigma 0.5)
+
+    Returns:
+        np.ndarray: array of shape (n,)
+    """
+    if distribution == "uniform":
+        return rng.uniform(0.5 * mean, 1.5 * mean, size=n)
+    if distribution == "normal":
+        return np.maximum(rng.normal(mean, mean / 4, size=n), mean / 10)
+    if distribution == "lognormal":
+        sigma = 0.5
+        return rng.lognormal(np.log(mean) - sigma ** 2 / 2, sigma, size=n)
+    raise ValueError("Unknown cost distribution: %s" % distribution)
+
+def generate_instance(filename: str, n_main_station: int, n_satellite_station: int, seed=None, cost_distribution: str = "uniform",
+                      coordinate_distribution: str = "uniform", cost_scale: float = 6.0) -> None:
+    """Generate a random instance and write it to a file
+
+    Args:
+        filename (str): path of the instance file to write
+        n_main_station (int): number of main stations
+        n_satellite_station (int): number of satellite stations
+        seed (int): seed of the instance
+        cost_distribution (str): distribution of the opening costs (see generate_opening_costs)
+        coordinate_distribution (str): distribution of the coordinates (see generate_coordinates)
+        cost_scale (float): mean opening cost per satellite station (about the ratio of instance_C_50_75)
+    """
+    rng = np.random.default_rng(seed)
+    main_coordinates = generate_coordinates(rng, n_main_station, coordinate_distribution)
+    opening_cost = generate_opening_costs(rng, n_main_station, cost_scale * n_satellite_station, cost_distribution)
+    satellite_coordinates = generate_coordinates(rng, n_satellite_station, coordinate_distribution)
+    folder = os.path.dirname(filename)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(filename, "w") as f:
+        f.write("%d %d 0\n" % (n_main_station, n_satellite_station))
+        np.savetxt(f, np.column_stack((main_coordinates, opening_cost)), fmt="%f")
+        np.savetxt(f, satellite_coordinates, fmt="%f")
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-main', type=int, required=True)
+    parser.add_argument('--n-satellite', type=int, required=True)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--costs', type=str, default='uniform', choices=COST_DISTRIBUTIONS)
+    parser.add_argument('--coordinates', type=str, default='uniform', choices=COORDINATE_DISTRIBUTIONS)
+    parser.add_argument('--cost-scale', type=float, default=6.0)
+    # default: instances/generated/instance_<costs>_<n_main>_<n_satellite>_s<seed>.txt
+    parser.add_argument('--outfile', type=str, default=None)
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    outfile = args.outfile or "instances/generated/instance_%s_%d_%d_s%d.txt" % (args.costs, args.n_main, args.n_satellite, args.seed)
+    generate_instance(outfile, args.n_main, args.n_satellite, args.seed, args.costs, args.coordinates, args.cost_scale)
+    print("[INFO] instance written: %s" % outfile)
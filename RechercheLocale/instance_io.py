@@ -0,0 +1,114 @@
+import os
+import numpy as np
+"""
+    Fast loading of the instances files (instances/*.txt) with a binary cache written next to the instance.
+
+    Format of an instance : a first line "n_main_station n_satellite_station 0", then one line "x y opening_cost"
+    per main station and one line "x y" per satellite station. The file is parsed in bulk with NumPy and the
+    arrays are cached in <instance>.cache.npz, the distance matrix can also be cached in <instance>.dist.npy
+    and memory-mapped (with the stamp of the instance file in <instance>.dist.stamp.npy). A cache is used only if
+    the instance file did not change since it was written (same size and modification time).
+"""
+
+def parse_instance(filename: str):
+    """Parse an instance file in bulk
+
+    Args:
+        filename (str): path of the instance file
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: opening costs (n,), coordinates of the main stations (n, 2)
+        and coordinates of the satellite stations (m, 2)
+    """
+    with open(filename, "r") as f:
+        header = f.readline().split()
+        n_main_station, n_satellite_station = int(header[0]), int(header[1])
+        values = np.array(f.read().split(), dtype=np.float64)
+    expected = 3 * n_main_station + 2 * n_satellite_station
+    if len(values) < expected:
+        raise ValueError("Instance %s: expected %d values, found %d" % (filename, expected, len(values)))
+    main_stations = values[:3 * n_main_station].reshape(n_main_station, 3)
+    satellite_stations = values[3 * n_main_station:expected].reshape(n_satellite_station, 2)
+    return (np.ascontiguousarray(main_stations[:, 2]), np.ascontiguousarray(main_stations[:, :2]),
+            np.ascontiguousarray(satellite_stations))
+
+def cache_paths(filename: str):
+    """Paths of the cache files of an instance file : (arrays cache, distance matrix cache, stamp of the distance matrix cache)"""
+    base = os.path.splitext(filename)[0]
+    return base + ".cache.npz", base + ".dist.npy", base + ".dist.stamp.npy"
+
+def _stamp(filename: str) -> np.ndarray:
+    stat = os.stat(filename)
+    return np.array([stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+
+def _atomic_write(path: str, write, ignore_errors: bool = True) -> None:
+    """Write a file through a temporary file in the same folder, then rename it
+
+    Args:
+        path (str): file to write
+        write (callable): write(f) writes the content in the binary file f
+        ignore_errors (bool): give up silently on OSError (for caches), otherwise the error is raised
+    """
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except OSError:
+        # read-only folder : the cache is only an optimization
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if not ignore_errors:
+            raise
+
+def load_instance_arrays(filename: str, use_cache: bool = True):
+    """Load the arrays of an instance file, from its cache when it is up to date
+
+    Args:
+        filename (str): path of the instance file
+        use_cache (bool): read and write the .cache.npz file next to the instance
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: same as parse_instance
+    """
+    if not use_cache:
+        return parse_instance(filename)
+    cache_path = cache_paths(filename)[0]
+    stamp = _stamp(filename)
+    if os.path.exists(cache_path):
+        try:
+            with np.load(cache_path) as cache:
+                if np.array_equal(cache["stamp"], stamp):
+                    return cache["opening_cost"], cache["main_coordinates"], cache["satellite_coordinates"]
+        except (OSError, ValueError, KeyError):
+            pass
+    arrays = parse_instance(filename)
+    _atomic_write(cache_path, lambda f: np.savez(f, stamp=stamp, opening_cost=arrays[0], main_coordinates=arrays[1], satellite_coordinates=arrays[2]))
+    return arrays
+
+def load_distance_matrix(filename: str, shape, compute):
+    """Load the distance matrix of an instance file memory-mapped from its cache, or compute and cache it
+
+    Args:
+        filename (str): path of the instance file
+        shape (Tuple[int, int]): expected shape (n_main_station, n_satellite_station)
+        compute (callable): function computing the matrix when the cache is missing or outdated
+
+    Returns:
+        np.ndarray: the distance matrix (read-only memory map when read from the cache)
+    """
+    _, matrix_path, stamp_path = cache_paths(filename)
+    stamp = _stamp(filename)
+    if os.path.exists(matrix_path) and os.path.exists(stamp_path):
+        try:
+            if np.array_equal(np.load(stamp_path), stamp):
+                matrix = np.load(matrix_path, mmap_mode="r")
+                if matrix.shape == tuple(shape) and matrix.dtype == np.float64:
+                    return matrix
+        except (OSError, ValueError):
+            pass
+    matrix = compute()
+    # the stamp is written last : a matrix being replaced is never read with the stamp of the new instance file
+    _atomic_write(matrix_path, lambda f: np.save(f, matrix))
+    _atomic_write(stamp_path, lambda f: np.save(f, stamp))
+    return matrix
@@ -1,9 +1,13 @@
 import argparse
+import cProfile
 import time
 
 import random_solver
 import solver
+import metaheuristics
 from uflp import UFLP
+from checkpoint import Checkpoint
+import profiling
 
 def parse_arguments():
     parser = argparse.ArgumentParser()
@@ -13,13 +17,44 @@ def parse_arguments():
     parser.add_argument('--infile', type=str, default='instance_A_4_6')
     # if --preview is present, preview is at true else false
     parser.add_argument('--preview', action='store_true')
+    # save the preview image (instances/<infile>.png) without opening a window, no display needed
+    parser.add_argument('--headless', action='store_true')
+    # advanced agent: number of worker processes for the restarts (0 for all the CPUs) and seed
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=None)
+    # advanced, annealing, tabu and genetic agents: time budget in seconds, the best solution found is returned at the deadline
+    parser.add_argument('--time-limit', type=float, default=None)
+    # keep only the k nearest main stations of each satellite station instead of the full distance matrix
+    parser.add_argument('--sparse-k', type=int, default=None)
+    # advanced agent: exploration of the neighbourhood by the local searches (best, first or random improvement)
+    parser.add_argument('--neighbourhood', type=str, default='best', choices=['best', 'first', 'random'])
+    # advanced agent: stop when the gap with the Lagrangian lower bound falls below this ratio (e.g. 0.001)
+    parser.add_argument('--gap-tolerance', type=float, default=None)
+    # advanced, annealing, tabu and genetic agents: save the state of the search in a file every few seconds,
+    # --resume continues the run saved in that file (same result as an uninterrupted run with the same seed).
+    # The advanced agent saves after its initial searches and between restarts: a local search in progress is redone
+    # from its start, the other agents save between iterations / generations
+    parser.add_argument('--checkpoint', type=str, default=None)
+    parser.add_argument('--checkpoint-interval', type=float, default=5.0)
+    parser.add_argument('--resume', action='store_true')
+    # per phase summary of the solve (calls and time), and optionally a cProfile/pstats file
+    parser.add_argument('--profile', action='store_true')
+    parser.add_argument('--profile-output', type=str, default=None)
 
 
     return parser.parse_args()
 
+def print_improvement(elapsed, cost, solution):
+    print("[INFO] %.3f s : new best solution, penality %s" % (elapsed, cost))
+
+def print_gap(elapsed, lower_bound, cost, gap):
+    print("[INFO] %.3f s : lower bound %s, gap %.4f %%" % (elapsed, lower_bound, 100 * gap))
+
 if __name__ == '__main__':
     args = parse_arguments()
-    uflp = UFLP(args.infile)
+    if args.gap_tolerance is not None and args.sparse_k is not None:
+        raise Exception("--gap-tolerance needs the full distance matrix, it can not be used with --sparse-k")
+    uflp = UFLP(args.infile, sparse_k=args.sparse_k)
 
     print("***********************************************************")
     print("[INFO] Start the solving: train network design")
@@ -29,15 +64,41 @@ if __name__ == '__main__':
     print("[INFO] number of satellite stations: %s" % (uflp.n_satellite_station))
     print("***********************************************************")
 
+    if args.profile:
+        profiling.enable()
+    if args.profile_output:
+        profiler = cProfile.Profile()
+        profiler.enable()
     start_time = time.time()
+    checkpoint = None
+    if args.checkpoint:
+        checkpoint = Checkpoint(args.checkpoint, args.checkpoint_interval, resume=args.resume)
+    elif args.resume:
+        raise Exception("--resume needs the --checkpoint file")
+    if checkpoint is not None and args.agent == "random":
+        raise Exception("The random agent does not support --checkpoint")
 
 
     if args.agent == "random":
         main_stations_opened, satellite_station_association = random_solver.solve(uflp)
     elif args.agent == "advanced":
         # Your nice agent
-        main_stations_opened, satellite_station_association =  solver.solve(uflp)
-
+        main_stations_opened, satellite_station_association =  solver.solve(uflp, n_workers=args.workers or None, seed=args.seed,
+                                                                   time_limit=args.time_limit, callback=print_improvement,
+                                                                   neighbourhood=args.neighbourhood, gap_tolerance=args.gap_tolerance,
+                                                                   gap_callback=print_gap, checkpoint=checkpoint)
+    elif args.agent == "annealing":
+        main_stations_opened, satellite_station_association = metaheuristics.simulated_annealing(uflp, seed=args.seed,
+                                                                   time_limit=args.time_limit, callback=print_improvement,
+                                                                   checkpoint=checkpoint)
+    elif args.agent == "tabu":
+        main_stations_opened, satellite_station_association = metaheuristics.tabu_search(uflp, seed=args.seed,
+                                                                   time_limit=args.time_limit, callback=print_improvement,
+                                                                   checkpoint=checkpoint)
+    elif args.agent == "genetic":
+        main_stations_opened, satellite_station_association = metaheuristics.genetic_algorithm(uflp, seed=args.seed,
+                                                                   time_limit=args.time_limit, callback=print_improvement,
+                                                                   checkpoint=checkpoint)
     else:
         raise Exception("This agent does not exist")
     
@@ -45,6 +106,11 @@ if __name__ == '__main__':
 
 
     solving_time = round((time.time() - start_time) / 60,2)
+    if args.profile_output:
+        profiler.disable()
+        profiler.dump_stats(args.profile_output)
+    if args.profile:
+        profiling.disable()
 
     print("***********************************************************")
     print("[INFO] Solution obtained")
@@ -55,5 +121,14 @@ if __name__ == '__main__':
     print("[INFO] Sanity check passed : %s" % uflp.solution_checker(main_stations_opened, satellite_station_association))
     print("***********************************************************")
 
+    if args.profile:
+        print("[INFO] Profile of the solve :")
+        print(profiling.summary())
+        # restarts run in worker processes have their own cache
+        print("[INFO] Evaluation cache of the main process : %s" % uflp.get_evaluation_cache().stats())
+        if args.profile_output:
+            print("[INFO] cProfile stats written to %s" % args.profile_output)
+        print("***********************************************************")
+
     if args.preview:
-        uflp.show_solution(main_stations_opened, satellite_station_association)
\ No newline at end of file
+        uflp.show_solution(main_stations_opened, satellite_station_association, show=not args.headless)
\ No newline at end of file
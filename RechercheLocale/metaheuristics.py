@@ -0,0 +1,326 @@
+from uflp import UFLP
+from evaluator import IncrementalEvaluator, make_evaluator
+import solver
+from checkpoint import instance_digest, solution_state, state_solution
+from functools import partial
+from typing import List, Tuple
+import math
+import time
+import numpy as np
+"""
+    Métaheuristiques alternatives à la recherche locale avec restarts de solver.py : recuit simulé, recherche tabou
+    et algorithme génétique. Les deux premières partent de la recherche locale depuis cheap_solution_2 et utilisent deux
+    types de mouvements : l'ouverture/fermeture d'une gare principale (flip) et l'échange d'une gare ouverte avec une
+    gare fermée (swap). Tous les mouvements sont évalués de façon incrémentale par evaluator.make_evaluator, jamais par
+    calculate_cost. L'algorithme génétique évalue au contraire toute une génération d'un coup (UFLP.calculate_costs).
+"""
+
+def initial_evaluator(problem: UFLP) -> IncrementalEvaluator:
+    """Evaluator on the local minimum reached from cheap_solution_2"""
+    sol = solver.local_search(problem, depth=None, initial_solution=solver.cheap_solution_2)
+    return make_evaluator(problem, sol[0])
+
+def simulated_annealing(problem: UFLP, seed=None, time_limit=None, callback=None, n_iterations=None,
+                        swap_probability=0.5, initial_acceptance=0.3, final_temperature_ratio=1e-3, checkpoint=None) -> Tuple[List[int], List[int]]:
+    """Simulated annealing on flip and swap moves with a geometric cooling.
+
+    Args:
+        problem (UFLP): instance of the problem
+        seed (int): seed of the random moves
+        time_limit (float): duration in seconds, the cooling then follows the elapsed time instead of the iterations
+        callback (callable): called as callback(elapsed, cost, solution) on every improvement of the best solution
+        n_iterations (int): number of moves tried (default 500 per main station), ignored with a time_limit
+        swap_probability (float): probability to try a swap rather than a flip
+        initial_acceptance (float): probability to accept an average worsening move at the initial temperature
+        final_temperature_ratio (float): final temperature / initial temperature
+        checkpoint (checkpoint.Checkpoint): periodic save of the state (current and best solutions, iteration, initial
+            temperature, random generator) to resume an interrupted run with the same result
+
+    Returns:
+        Tuple[List[int], List[int]]: opened main stations and association of the satellite stations (best solution found)
+    """
+    start_time = time.time()
+    rng = np.random.default_rng(seed)
+    if n_iterations is None:
+        n_iterations = 500 * problem.n_main_station
+    config = {"strategy": "annealing", "instance": problem.instance_name, "instance_digest": instance_digest(problem),
+              "n_main_station": problem.n_main_station, "n_satellite_station": problem.n_satellite_station, "seed": seed,
+              "time_limit": time_limit, "n_iterations": n_iterations,
+              "swap_probability": swap_probability, "initial_acceptance": initial_acceptance, "final_temperature_ratio": final_temperature_ratio}
+    state = checkpoint.restore(config) if checkpoint is not None else None
+    if state is not None:
+        start_time -= state["elapsed"]
+        rng.bit_generator.state = state["rng"]
+        evaluator = make_evaluator(problem, np.unpackbits(state["opened"], count=problem.n_main_station))
+        best_cost, best_sol = state_solution(state, problem.n_main_station)
+        initial_temperature = state["initial_temperature"]
+        i = state["iteration"]
+        if callback is not None:
+            callback(time.time() - start_time, best_cost, best_sol)
+    else:
+        evaluator = initial_evaluator(problem)
+        best_cost, best_sol = evaluator.cost, evaluator.solution()
+        if callback is not None:
+            callback(time.time() - start_time, best_cost, best_sol)
+        if problem.n_main_station == 1:
+            return best_sol
+
+        # initial temperature from the average worsening of random flips
+        deltas = evaluator.all_deltas()
+        worsening = deltas[np.isfinite(deltas) & (deltas > 0)]
+        average_worsening = worsening.mean() if len(worsening) else 1.0
+        initial_temperature = -average_worsening / math.log(initial_acceptance)
+        i = 0
+    def save_checkpoint():
+        checkpoint_state = {"iteration": i, "elapsed": time.time() - start_time, "rng": rng.bit_generator.state,
+                            "opened": np.packbits(evaluator.opened), "initial_temperature": initial_temperature}
+        checkpoint_state.update(solution_state(best_cost, best_sol))
+        checkpoint.save(config, checkpoint_state)
+
+    while True:
+        if checkpoint is not None and i % 1024 == 0 and checkpoint.due():
+            save_checkpoint()
+        if time_limit is None:
+            if i >= n_iterations:
+                break
+            progress = i / n_iterations
+        else:
+            progress = (time.time() - start_time) / time_limit
+            if progress >= 1:
+                break
+        temperature = initial_temperature * final_temperature_ratio ** progress
+        i += 1
+
+        # random move, evaluated incrementally
+        opened = evaluator.opened
+        if rng.random() < swap_probability and 0 < evaluator.n_opened < problem.n_main_station:
+            closed_station = int(rng.choice(np.flatnonzero(opened)))
+            opened_station = int(rng.choice(np.flatnonzero(~opened)))
+            delta = evaluator.swap_delta(closed_station, opened_station)
+            move = (evaluator.swap, closed_station, opened_station)
+        else:
+            station = int(rng.integers(problem.n_main_station))
+            delta = evaluator.delta(station)
+            move = (evaluator.flip, station)
+        if math.isinf(delta):
+            continue
+        # Metropolis criterion
+        if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+            move[0](*move[1:])
+            if evaluator.cost < best_cost - 1e-9:
+                best_cost, best_sol = evaluator.cost, evaluator.solution()
+                if callback is not None:
+                    callback(time.time() - start_time, best_cost, best_sol)
+    if checkpoint is not None:
+        save_checkpoint()
+    return best_sol
+
+def tabu_search(problem: UFLP, seed=None, time_limit=None, callback=None, n_iterations=None,
+                max_no_improvement=None, tenure=(5, 10), n_swap_candidates=10, checkpoint=None) -> Tuple[List[int], List[int]]:
+    """Tabu search on flip and swap moves.
+
+    At each iteration the best non tabu move is applied, even if it worsens the solution. A station that was flipped
+    or swapped cannot be moved again during a random tenure, unless the move gives a new best solution (aspiration).
+    All flips are evaluated, swaps only for a random sample of opened stations.
+
+    Args:
+        problem (UFLP): instance of the problem
+        seed (int): seed of the tenures and of the swap candidates
+        time_limit (float): duration in seconds (the search also stops after n_iterations)
+        callback (callable): called as callback(elapsed, cost, solution) on every improvement of the best solution
+        n_iterations (int): maximum number of iterations (default 5 per main station, unbounded with a time_limit)
+        max_no_improvement (int): stop after this number of iterations without improvement (default 1 per main station)
+        tenure (Tuple[int, int]): bounds of the random number of iterations during which a moved station is tabu
+        n_swap_candidates (int): number of opened stations whose swaps are evaluated at each iteration
+        checkpoint (checkpoint.Checkpoint): periodic save of the state (current and best solutions, tabu list, iteration
+            counters, random generator) to resume an interrupted run with the same result
+
+    Returns:
+        Tuple[List[int], List[int]]: opened main stations and association of the satellite stations (best solution found)
+    """
+    start_time = time.time()
+    rng = np.random.default_rng(seed)
+    if n_iterations is None:
+        n_iterations = math.inf if time_limit is not None else 5 * problem.n_main_station
+    if max_no_improvement is None:
+        max_no_improvement = math.inf if time_limit is not None else problem.n_main_station
+    config = {"strategy": "tabu", "instance": problem.instance_name, "instance_digest": instance_digest(problem),
+              "n_main_station": problem.n_main_station, "n_satellite_station": problem.n_satellite_station, "seed": seed,
+              "time_limit": time_limit, "n_iterations": n_iterations,
+              "max_no_improvement": max_no_improvement, "tenure": tenure, "n_swap_candidates": n_swap_candidates}
+    state = checkpoint.restore(config) if checkpoint is not None else None
+    if state is not None:
+        start_time -= state["elapsed"]
+        rng.bit_generator.state = state["rng"]
+        evaluator = make_evaluator(problem, np.unpackbits(state["opened"], count=problem.n_main_station))
+        best_cost, best_sol = state_solution(state, problem.n_main_station)
+        tabu_until = state["tabu_until"]
+        i, last_improvement = state["iteration"], state["last_improvement"]
+    else:
+        evaluator = initial_evaluator(problem)
+        best_cost, best_sol = evaluator.cost, evaluator.solution()
+        tabu_until = np.zeros(problem.n_main_station, dtype=np.int64)
+        i = 0
+        last_improvement = 0
+    if callback is not None:
+        callback(time.time() - start_time, best_cost, best_sol)
+    def save_checkpoint():
+        checkpoint_state = {"iteration": i, "last_improvement": last_improvement, "elapsed": time.time() - start_time,
+                            "rng": rng.bit_generator.state, "opened": np.packbits(evaluator.opened), "tabu_until": tabu_until}
+        checkpoint_state.update(solution_state(best_cost, best_sol))
+        checkpoint.save(config, checkpoint_state)
+
+    while i < n_iterations and i - last_improvement < max_no_improvement:
+        if checkpoint is not None and checkpoint.due():
+            save_checkpoint()
+        if time_limit is not None and time.time() - start_time >= time_limit:
+            break
+        i += 1
+        not_tabu = tabu_until < i
+        # aspiration : a tabu move is allowed if it gives a new best solution
+        aspiration_delta = best_cost - evaluator.cost - 1e-9
+
+        deltas = evaluator.all_deltas()
+        allowed = np.isfinite(deltas) & (not_tabu | (deltas < aspiration_delta))
+        best_move, best_delta = None, math.inf
+        if allowed.any():
+            station = int(np.argmin(np.where(allowed, deltas, np.inf)))
+            best_move, best_delta = (station,), deltas[station]
+
+        opened = np.flatnonzero(evaluator.opened)
+        if 0 < len(opened) < problem.n_main_station:
+            for closed_station in rng.permutation(opened)[:n_swap_candidates]:
+                swap_deltas = evaluator.swap_deltas(closed_station)
+                if not_tabu[closed_station]:
+                    allowed = not_tabu | (swap_deltas < aspiration_delta)
+                else:
+                    allowed = swap_deltas < aspiration_delta
+                swap_deltas = np.where(allowed, swap_deltas, np.inf)
+                opened_station = int(np.argmin(swap_deltas))
+                if swap_deltas[opened_station] < best_delta:
+                    best_move, best_delta = (int(closed_station), opened_station), swap_deltas[opened_station]
+
+        # every move is tabu
+        if best_move is None:
+            continue
+        if len(best_move) == 1:
+            evaluator.flip(best_move[0])
+        else:
+            evaluator.swap(*best_move)
+        for station in best_move:
+            tabu_until[station] = i + rng.integers(tenure[0], tenure[1] + 1)
+        if evaluator.cost < best_cost - 1e-9:
+            best_cost, best_sol = evaluator.cost, evaluator.solution()
+            last_improvement = i
+            if callback is not None:
+                callback(time.time() - start_time, best_cost, best_sol)
+    if checkpoint is not None:
+        save_checkpoint()
+    return best_sol
+
+def genetic_algorithm(problem: UFLP, seed=None, time_limit=None, callback=None, population_size=64, n_generations=None,
+                      n_elites=2, tournament_size=2, mutation_rate=None, chunk_size=None, checkpoint=None) -> Tuple[List[int], List[int]]:
+    """Genetic algorithm on the masks of opened main stations, a whole generation being evaluated in one vectorized pass.
+
+    The masks are bit-packed (8 main stations per byte) : uniform crossover and bit flip mutation are bitwise operations
+    on the packed arrays, and the children of a generation are evaluated together by UFLP.calculate_costs (masked min
+    over the distance matrix, by chunks). The parents are chosen by tournament and the best masks are kept (elitism).
+    The population starts from the local minimum of cheap_solution_2 and random masks of random densities, and the
+    best mask found is finally improved by a local search.
+
+    Args:
+        problem (UFLP): instance of the problem
+        seed (int): seed of the population, the selections, the crossovers and the mutations
+        time_limit (float): duration in seconds (the last tenth is left to the final local search)
+        callback (callable): called as callback(elapsed, cost, solution) on every improvement of the best solution
+        population_size (int): number of masks of the population
+        n_generations (int): number of generations (default 100), ignored with a time_limit
+        n_elites (int): number of best masks copied to the next generation
+        tournament_size (int): number of masks drawn to select each parent
+        mutation_rate (float): probability to flip each main station of a child (default 1 / n_main_station)
+        chunk_size (int): maximum number of costs per block of the population evaluation (see UFLP.calculate_costs)
+        checkpoint (checkpoint.Checkpoint): periodic save of the state (packed population and its costs, best mask,
+            generation, random generator) to resume an interrupted run with the same result
+
+    Returns:
+        Tuple[List[int], List[int]]: opened main stations and association of the satellite stations (best solution found)
+    """
+    start_time = time.time()
+    rng = np.random.default_rng(seed)
+    n_main_station = problem.n_main_station
+    if n_generations is None:
+        n_generations = 100
+    if mutation_rate is None:
+        mutation_rate = 1.0 / n_main_station
+    n_elites = min(n_elites, population_size - 1)
+    forbidden = problem.forbidden_main_stations
+    allowed = np.packbits(~forbidden)
+    unpack = lambda packed: np.unpackbits(packed, axis=1, count=n_main_station).view(bool)
+    def report(cost, mask):
+        if callback is not None:
+            callback(time.time() - start_time, cost, (mask.astype(np.int32).tolist(), solver.assign_nearest_mains(problem, mask)))
+    config = {"strategy": "genetic", "instance": problem.instance_name, "instance_digest": instance_digest(problem),
+              "n_main_station": n_main_station, "n_satellite_station": problem.n_satellite_station, "seed": seed, "time_limit": time_limit,
+              "population_size": population_size, "n_generations": n_generations, "n_elites": n_elites,
+              "tournament_size": tournament_size, "mutation_rate": mutation_rate}
+    state = checkpoint.restore(config) if checkpoint is not None else None
+    if state is not None:
+        start_time -= state["elapsed"]
+        rng.bit_generator.state = state["rng"]
+        population, costs, generation = state["population"], state["costs"], state["generation"]
+        best_cost, best_mask = state["best_cost"], np.unpackbits(state["best_opened"], count=n_main_station).view(bool)
+    else:
+        # initial population : local minimum of cheap_solution_2 and random masks
+        masks = rng.random((population_size, n_main_station)) < rng.random((population_size, 1))
+        masks[0] = initial_evaluator(problem).opened
+        population = np.packbits(masks, axis=1) & allowed
+        costs = problem.calculate_costs(unpack(population), chunk_size)
+        best = int(np.argmin(costs))
+        best_cost, best_mask = costs[best], unpack(population[best:best + 1])[0].copy()
+        generation = 0
+    report(best_cost, best_mask)
+    def save_checkpoint():
+        checkpoint.save(config, {"generation": generation, "elapsed": time.time() - start_time, "rng": rng.bit_generator.state,
+                                 "population": population, "costs": costs, "best_cost": float(best_cost),
+                                 "best_opened": np.packbits(best_mask)})
+
+    while True:
+        if checkpoint is not None and checkpoint.due():
+            save_checkpoint()
+        if time_limit is None:
+            if generation >= n_generations:
+                break
+        elif time.time() - start_time >= 0.9 * time_limit:
+            break
+        generation += 1
+        order = np.argsort(costs, kind="stable")
+        n_children = population_size - n_elites
+        # tournament selection of the two parents of each child
+        contestants = rng.integers(population_size, size=(2, n_children, tournament_size))
+        parents = np.take_along_axis(contestants, np.argmin(costs[contestants], axis=2)[..., np.newaxis], axis=2)[..., 0]
+        # uniform crossover : each bit comes from the first parent where the random mask is set
+        crossover = rng.integers(256, size=(n_children, population.shape[1]), dtype=np.uint8)
+        children = (population[parents[0]] & crossover) | (population[parents[1]] & ~crossover)
+        # bit flip mutation, forbidden stations stay closed
+        children ^= np.packbits(rng.random((n_children, n_main_station)) < mutation_rate, axis=1)
+        children &= allowed
+        children_costs = problem.calculate_costs(unpack(children), chunk_size)
+        population = np.concatenate((population[order[:n_elites]], children))
+        costs = np.concatenate((costs[order[:n_elites]], children_costs))
+        best = int(np.argmin(children_costs))
+        if children_costs[best] < best_cost - 1e-9:
+            best_cost, best_mask = children_costs[best], unpack(children[best:best + 1])[0].copy()
+            report(best_cost, best_mask)
+
+    if checkpoint is not None:
+        save_checkpoint()
+    # final local search from the best mask
+    fixed = (np.zeros(n_main_station, dtype=bool), forbidden) if forbidden.any() else None
+    deadline = None if time_limit is None else start_time + time_limit
+    sol = solver.local_search(problem, depth=None, initial_solution=partial(solver.repair_solution, solution=(best_mask, None)),
+                              deadline=deadline, fixed=fixed)
+    # the descent only applies improving moves
+    cost = problem.calculate_cost(sol[0], sol[1])
+    if cost < best_cost - 1e-9 and callback is not None:
+        callback(time.time() - start_time, cost, sol)
+    return sol
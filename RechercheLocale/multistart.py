@@ -0,0 +1,106 @@
+from uflp import UFLP
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import itertools
+import math
+import os
+import time
+import numpy as np
+
+# instance rebuilt once in each worker process by _init_worker
+_worker_problem = None
+
+def _init_worker(instance_name: str, opening_cost: np.ndarray, main_coordinates: np.ndarray, satellite_coordinates: np.ndarray, sparse_k=None,
+                 connection_cost_matrix=None) -> None:
+    """Rebuild the instance in a worker process from its arrays (sent once per worker)
+
+    The distance matrix is only sent when the connection costs are not derived from the coordinates.
+    """
+    global _worker_problem
+    _worker_problem = UFLP.from_arrays(instance_name, opening_cost, main_coordinates, satellite_coordinates, sparse_k=sparse_k,
+                                       connection_cost_matrix=connection_cost_matrix)
+
+def _run_in_worker(task, seed: np.random.SeedSequence):
+    return task(_worker_problem, seed)
+
+def restart_seeds(n_restarts=None, seed=None, first_restart=0):
+    """Independent seed of each restart, derived from a single seed (lazy, infinite if n_restarts is None)
+
+    The seed of a restart only depends on its index, so results do not depend on the number of workers and a run
+    can be resumed from any restart.
+    """
+    root = np.random.SeedSequence(seed)
+    indices = itertools.count(first_restart) if n_restarts is None else range(first_restart, n_restarts)
+    for i in indices:
+        yield np.random.SeedSequence(root.entropy, spawn_key=(i,))
+
+def run_multistart(problem: UFLP, task, n_restarts=None, n_workers=1, seed=None, deadline=None, best=(math.inf, None), on_improvement=None,
+                   stop=None, first_restart=0, on_progress=None):
+    """Run independent restarts, possibly on a process pool, and keep the best result
+
+    Args:
+        problem (UFLP): instance of the problem
+        task (callable): picklable function task(problem, seed) returning a tuple (cost, solution), seed is a np.random.SeedSequence
+        n_restarts (int): number of restarts, None to run restarts until the deadline
+        n_workers (int): number of worker processes, None for the number of CPUs, 1 to run in the current process
+        seed (int): seed of the restarts (None for a random one)
+        deadline (float): time.time() after which no restart is started (the task should stop on it too)
+        best (Tuple[float, solution]): best known result, only better results are kept
+        on_improvement (callable): called as on_improvement(cost, solution) every time the best result improves
+        stop (callable): called as stop(cost) after every improvement, no more restarts are run once it returns True
+        first_restart (int): index of the first restart to run (the previous ones are in best), to resume a run
+        on_progress (callable): called as on_progress(n_restarts_done, (cost, solution)) after every restart, in the order
+            of the restarts, with the number of restarts done (first_restart included) and the best result so far
+
+    Returns:
+        Tuple[float, solution]: cost and solution of the best restart (first one on ties), best if nothing better was found
+    """
+    if n_restarts is None and deadline is None:
+        raise ValueError("n_restarts or deadline must be given")
+    seeds = restart_seeds(n_restarts, seed, first_restart)
+    if deadline is not None:
+        seeds = itertools.takewhile(lambda _: time.time() < deadline, seeds)
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    if n_workers == 1 or n_restarts == 1:
+        return _best_result((task(problem, s) for s in seeds), best, on_improvement, stop, first_restart, on_progress)
+    init_args = (problem.instance_name, problem.main_stations_opening_cost_array,
+                 problem.main_stations_coordinates_array, problem.satellite_stations_coordinates_array, problem.sparse_k,
+                 problem.connection_cost_matrix if problem.custom_connection_costs else None)
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=init_args) as executor:
+        results = _pool_results(executor, task, seeds, 2 * n_workers)
+        try:
+            return _best_result(results, best, on_improvement, stop, first_restart, on_progress)
+        finally:
+            # cancels the restarts not started yet when stopped early
+            results.close()
+
+def _pool_results(executor: ProcessPoolExecutor, task, seeds, max_pending: int):
+    """Results of the restarts run on the pool, in the order of the restarts : same best solution as a sequential run.
+    Only max_pending restarts are submitted in advance so the seeds can be an infinite iterator."""
+    pending = deque()
+    try:
+        for s in seeds:
+            pending.append(executor.submit(_run_in_worker, task, s))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+def _best_result(results, best, on_improvement, stop=None, first_restart=0, on_progress=None):
+    """Best (cost, solution) of an iterable of results, first one on ties"""
+    best_cost, best_sol = best
+    for n_done, (cost, sol) in enumerate(results, first_restart + 1):
+        improved = cost < best_cost
+        if improved:
+            best_cost, best_sol = cost, sol
+            if on_improvement is not None:
+                on_improvement(cost, sol)
+        if on_progress is not None:
+            on_progress(n_done, (best_cost, best_sol))
+        if improved and stop is not None and stop(best_cost):
+            break
+    return best_cost, best_sol
@@ -0,0 +1,98 @@
+import functools
+import time
+"""
+    Opt-in instrumentation of the hot paths of the solvers : number of calls and time spent in each phase.
+
+    enable() replaces the functions and methods of HOT_PATHS by timed wrappers and disable() puts the originals
+    back, so nothing is paid while the instrumentation is disabled. Times are inclusive (local_search contains
+    the assign_nearest_mains of its initial solution, a restart contains its local search...). Only the current
+    process is measured : run the solver with a single worker to profile the restarts.
+
+    Usage : profiling.enable(); solver.solve(problem); profiling.disable(); print(profiling.summary())
+"""
+
+# (module name, owner in the module or None for a function of the module, attribute, phase name)
+HOT_PATHS = [
+    ("uflp", "UFLP", "calculate_cost", "calculate_cost"),
+    ("solver", None, "random_restart", "restart"),
+    ("solver", None, "local_search", "local_search"),
+    ("solver", None, "first_improvement", "first_improvement"),
+    ("solver", None, "assign_nearest_mains", "assign_nearest_mains"),
+    ("evaluator", "IncrementalEvaluator", "all_deltas", "neighbourhood_scan"),
+    ("evaluator", "IncrementalEvaluator", "swap_deltas", "swap_scan"),
+    ("evaluator", "IncrementalEvaluator", "flip", "move_applied"),
+    ("evaluator", "IncrementalEvaluator", "swap", "move_applied"),
+]
+
+# phase name -> [number of calls, total time in seconds]
+_stats = {}
+# (owner, attribute, original) of the patched functions
+_patched = []
+_evaluations_start = 0
+
+def _timed(name: str, function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stats = _stats[name]
+            stats[0] += 1
+            stats[1] += time.perf_counter() - start
+    return wrapper
+
+def is_enabled() -> bool:
+    return bool(_patched)
+
+def enable() -> None:
+    """Instrument the hot paths (HOT_PATHS) and reset the statistics"""
+    import importlib
+    if is_enabled():
+        return
+    reset()
+    for module_name, owner_name, attribute, name in HOT_PATHS:
+        module = importlib.import_module(module_name)
+        owner = module if owner_name is None else getattr(module, owner_name)
+        # only the class defining the method is patched (inherited methods are patched on the parent)
+        if owner_name is not None and attribute not in vars(owner):
+            continue
+        original = getattr(owner, attribute)
+        _stats.setdefault(name, [0, 0.0])
+        _patched.append((owner, attribute, original))
+        setattr(owner, attribute, _timed(name, original))
+
+def disable() -> None:
+    """Restore the original functions, the statistics are kept"""
+    while _patched:
+        owner, attribute, original = _patched.pop()
+        setattr(owner, attribute, original)
+
+def reset() -> None:
+    global _evaluations_start
+    from evaluator import IncrementalEvaluator
+    for stats in _stats.values():
+        stats[0], stats[1] = 0, 0.0
+    _evaluations_start = IncrementalEvaluator.n_evaluations
+
+def stats() -> dict:
+    """Statistics of each phase
+
+    Returns:
+        dict: phase name -> {"calls": int, "total_time": float, "mean_time": float}, and "moves_evaluated"
+    """
+    from evaluator import IncrementalEvaluator
+    result = {name: {"calls": calls, "total_time": total, "mean_time": total / calls if calls else 0.0}
+              for name, (calls, total) in _stats.items()}
+    result["moves_evaluated"] = IncrementalEvaluator.n_evaluations - _evaluations_start
+    return result
+
+def summary() -> str:
+    """Per phase summary as a printable table"""
+    lines = ["%-22s %12s %14s %14s" % ("phase", "calls", "total (s)", "mean (ms)")]
+    result = stats()
+    moves_evaluated = result.pop("moves_evaluated")
+    for name, phase in sorted(result.items(), key=lambda item: -item[1]["total_time"]):
+        lines.append("%-22s %12d %14.4f %14.4f" % (name, phase["calls"], phase["total_time"], 1000 * phase["mean_time"]))
+    lines.append("%-22s %12d" % ("moves_evaluated", moves_evaluated))
+    return "\n".join(lines)
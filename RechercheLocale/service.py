@@ -0,0 +1,288 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import solver
+from agents import STRATEGIES
+from uflp import UFLP
+"""
+    Local solver service : JSON over HTTP on localhost (or on a Unix socket), for many small solves.
+
+    The requests are solved by worker processes. Each worker keeps the instances it has loaded (coordinates,
+    distance matrix or candidate lists) in memory between requests, the least recently used ones being evicted
+    when the resident instances of the worker exceed its memory budget or when the free memory of the system runs
+    short. The requests of an instance always go to the same worker, so an instance is loaded in a single worker.
+    A request only pays for the solve, not for the imports and the loading.
+
+    Routes :
+        GET /health : status of the service
+        POST /solve : {"instance": "instance_C_50_75", "agent": "advanced", "seed": 0, "time_limit": 1.0,
+                       "sparse_k": null, "warm_start": [[0, 1, ...], [1, 1, ...]]}, only "instance" and "time_limit"
+                      (at most the timeout of the service) are required.
+                      Returns the solution, its cost and the time spent (see solve_request).
+
+    Example : python service.py --port 8175 --workers 4
+              curl -X POST localhost:8175/solve -d '{"instance": "instance_C_50_75", "time_limit": 1}'
+"""
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error",
+                504: "Gateway Timeout"}
+
+# instances loaded by a worker process : (instance name, sparse_k) -> UFLP, least recently used first
+_resident = OrderedDict()
+# eviction limits of the worker (see _init_worker)
+_max_memory = None
+_min_free_memory = None
+
+def _init_worker(max_memory=None, min_free_memory=None) -> None:
+    global _max_memory, _min_free_memory
+    _max_memory = max_memory
+    _min_free_memory = min_free_memory
+
+def _array_bytes(obj) -> int:
+    """Bytes of the NumPy arrays held by an object"""
+    return sum(value.nbytes for value in vars(obj).values() if isinstance(value, np.ndarray))
+
+def _list_bytes(values: list) -> int:
+    """Estimated bytes of a list of floats or of a list of such lists / tuples (float objects included)"""
+    if values and isinstance(values[0], (list, tuple)):
+        return sys.getsizeof(values) + sum(_list_bytes(value) for value in values)
+    return sys.getsizeof(values) + 24 * len(values)
+
+def instance_memory(problem: UFLP) -> int:
+    """Estimated bytes of an instance : its NumPy arrays (distance matrix or candidate lists, coordinates, costs), its
+    lists, its spatial index and its evaluation cache"""
+    total = _array_bytes(problem) + sum(_list_bytes(value) for value in vars(problem).values() if isinstance(value, list))
+    if getattr(problem, "spatial_index", None) is not None:
+        total += _array_bytes(problem.spatial_index)
+    if getattr(problem, "evaluation_cache", None) is not None:
+        total += problem.evaluation_cache.nbytes
+    return total
+
+def available_memory():
+    """Bytes of memory available on the system, None if unknown"""
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def _evict() -> None:
+    """Evict the least recently used instances until the limits of the worker are respected (the last one is kept)"""
+    while len(_resident) > 1:
+        over_budget = _max_memory is not None and sum(instance_memory(p) for p in _resident.values()) > _max_memory
+        free_memory = available_memory() if _min_free_memory is not None else None
+        if not over_budget and (free_memory is None or free_memory >= _min_free_memory):
+            return
+        _resident.popitem(last=False)
+
+def resident_instance(instance_name: str, sparse_k=None):
+    """Instance loaded in the current worker, loaded on first use
+
+    Returns:
+        Tuple[UFLP, bool]: the instance and True if it was already loaded
+    """
+    key = (instance_name, sparse_k)
+    problem = _resident.get(key)
+    resident = problem is not None
+    if not resident:
+        problem = UFLP(instance_name, sparse_k=sparse_k)
+        _resident[key] = problem
+    _resident.move_to_end(key)
+    _evict()
+    return problem, resident
+
+def solve_request(request: dict) -> dict:
+    """Solve a request in a worker process
+
+    Args:
+        request (dict): instance (name in the instances folder), agent (default "advanced"), seed, time_limit,
+            sparse_k, warm_start (previous solution, advanced agent only)
+
+    Returns:
+        dict: instance, agent, cost, feasible, main_stations_opened, satellite_station_association, time and
+            load_time (seconds), resident (True if the instance was already loaded)
+    """
+    start_time = time.perf_counter()
+    instance_name = request["instance"]
+    agent = request.get("agent", "advanced")
+    if agent not in STRATEGIES:
+        raise ValueError("This agent does not exist: %s" % agent)
+    problem, resident = resident_instance(instance_name, request.get("sparse_k"))
+    load_time = time.perf_counter() - start_time
+    seed = request.get("seed")
+    time_limit = request.get("time_limit")
+    if request.get("warm_start") is not None:
+        if agent != "advanced":
+            raise ValueError("warm_start is only supported by the advanced agent")
+        main_stations_opened, satellite_station_association = solver.solve(problem, seed=seed, time_limit=time_limit,
+                                                                            warm_start=request["warm_start"])
+    else:
+        main_stations_opened, satellite_station_association = STRATEGIES[agent](problem, seed, time_limit, None)
+    return {
+        "instance": instance_name,
+        "agent": agent,
+        "cost": problem.calculate_cost(main_stations_opened, satellite_station_association),
+        "feasible": problem.solution_checker(main_stations_opened, satellite_station_association),
+        "main_stations_opened": [int(v) for v in main_stations_opened],
+        "satellite_station_association": [int(v) for v in satellite_station_association],
+        "time": time.perf_counter() - start_time,
+        "load_time": load_time,
+        "resident": resident,
+    }
+
+def check_request(request) -> None:
+    """Raise ValueError if a solve request is malformed or names a file outside the instances folder"""
+    if not isinstance(request, dict) or not isinstance(request.get("instance"), str):
+        raise ValueError("The request must be a JSON object with an \"instance\" name")
+    name = os.path.normpath(request["instance"])
+    if os.path.isabs(name) or name.startswith(".."):
+        raise ValueError("The instance must be in the instances folder: %s" % request["instance"])
+    if not os.path.exists(os.path.join("instances", name + ".txt")):
+        raise FileNotFoundError("Unknown instance: %s" % request["instance"])
+    # without a time limit a solve has no bound on its duration in the worker
+    if request.get("time_limit") is None:
+        raise ValueError("time_limit is required")
+    time_limit = request["time_limit"]
+    if not isinstance(time_limit, (int, float)) or isinstance(time_limit, bool) or time_limit < 0:
+        raise ValueError("time_limit must be a positive number")
+    # integers only : a seed or sparse_k like 2.5 would fail in the worker
+    for field, minimum in (("seed", 0), ("sparse_k", 1)):
+        value = request.get(field)
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < minimum):
+            raise ValueError("%s must be an integer of at least %d" % (field, minimum))
+
+class SolverService():
+    """asyncio server answering the requests, the solves run on worker processes (one single process
+    ProcessPoolExecutor per worker, see worker_index)"""
+
+    def __init__(self, n_workers=None, max_memory_mb=None, min_free_memory_mb=None, timeout=60.0, grace_time=5.0) -> None:
+        """
+        Args:
+            n_workers (int): number of worker processes (None for the number of CPUs)
+            max_memory_mb (float): memory budget of the resident instances of each worker, in MiB (None for no budget)
+            min_free_memory_mb (float): instances are evicted while the free memory of the system is below it, in MiB
+            timeout (float): maximum time limit of the requests, in seconds
+            grace_time (float): time given to a request after its time limit (loading, end of the current move)
+        """
+        to_bytes = lambda mb: None if mb is None else int(mb * 2**20)
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.executors = [ProcessPoolExecutor(max_workers=1, initializer=_init_worker,
+                                              initargs=(to_bytes(max_memory_mb), to_bytes(min_free_memory_mb)))
+                          for _ in range(self.n_workers)]
+        self.timeout = timeout
+        self.grace_time = grace_time
+        self.n_requests = 0
+        self.start_time = time.time()
+
+    def worker_index(self, request: dict) -> int:
+        """Worker solving a request : the same one for all the requests of an instance (and sparse_k), which keeps
+        the instance resident. The requests of different instances are spread by a hash of their name."""
+        key = "%s\0%s" % (os.path.normpath(request["instance"]), request.get("sparse_k"))
+        return zlib.crc32(key.encode()) % self.n_workers
+
+    async def solve(self, request: dict) -> dict:
+        """Solve a request on the pool, TimeoutError if it lasts longer than its time limit plus the grace time
+
+        The time limit of the request is capped by the timeout of the service, so the worker stops by itself.
+        """
+        check_request(request)
+        time_limit = min(request["time_limit"], self.timeout)
+        request = dict(request, time_limit=time_limit)
+        timeout = time_limit + self.grace_time
+        loop = asyncio.get_running_loop()
+        # on timeout the answer is an error, the worker ends the solve at its own time limit
+        executor = self.executors[self.worker_index(request)]
+        return await asyncio.wait_for(loop.run_in_executor(executor, solve_request, request), timeout)
+
+    async def route(self, method: str, path: str, body: bytes):
+        """(status, JSON answer) of a request"""
+        if path == "/health":
+            return 200, {"status": "ok", "workers": self.n_workers, "requests": self.n_requests,
+                         "uptime": time.time() - self.start_time}
+        if path == "/solve":
+            if method != "POST":
+                return 405, {"error": "POST a JSON request to /solve"}
+            try:
+                return 200, await self.solve(json.loads(body or b"null"))
+            except asyncio.TimeoutError:
+                return 504, {"error": "The solve did not end in time"}
+            except FileNotFoundError as e:
+                return 404, {"error": str(e)}
+            except (ValueError, KeyError) as e:
+                return 400, {"error": str(e)}
+        return 404, {"error": "Unknown route: %s" % path}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer one HTTP/1.1 request per connection"""
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            self.n_requests += 1
+            if len(request_line) < 2:
+                status, answer = 400, {"error": "Malformed HTTP request"}
+            else:
+                try:
+                    status, answer = await self.route(request_line[0].upper(), request_line[1].split("?")[0], body)
+                except Exception as e:
+                    status, answer = 500, {"error": "%s: %s" % (type(e).__name__, e)}
+            payload = json.dumps(answer).encode()
+            writer.write(b"HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: close\r\n\r\n"
+                         % (status, HTTP_REASONS[status].encode(), len(payload)) + payload)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8175, unix_socket=None) -> None:
+        """Serve forever on host:port, or on a Unix socket if a path is given"""
+        if unix_socket is not None:
+            server = await asyncio.start_unix_server(self.handle, path=unix_socket)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self) -> None:
+        for executor in self.executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8175)
+    # serve on a Unix socket instead of TCP
+    parser.add_argument('--unix-socket', type=str, default=None)
+    parser.add_argument('--workers', type=int, default=0)
+    # eviction of the resident instances : budget of each worker and minimum free memory of the system (MiB)
+    parser.add_argument('--max-memory-mb', type=float, default=None)
+    parser.add_argument('--min-free-memory-mb', type=float, default=512)
+    # maximum time limit of the requests (seconds)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    service = SolverService(args.workers or None, args.max_memory_mb, args.min_free_memory_mb, args.timeout)
+    print("[INFO] solver service on %s with %d workers" % (args.unix_socket or "http://%s:%d" % (args.host, args.port), service.n_workers))
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.unix_socket))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
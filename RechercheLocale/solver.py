@@ -1,5 +1,13 @@
 from uflp import UFLP
+from evaluator import make_evaluator
+from evaluation_cache import EvaluationCache
+from multistart import run_multistart
+from bounds import lagrangian_bound, optimality_gap
+from checkpoint import instance_digest, solution_state, state_solution
+from functools import partial
 from typing import List, Tuple
+import math
+import time
 import numpy as np
 """ 
     Binome 1 : Blanquez Victor (2225992)
@@ -19,80 +27,304 @@ import numpy as np
     Les variables "nbr_random_local_searchs" et "depth_of_search" déclarées au début de la fonction solve()
     peuvent être modifiées pour changer le nombre et la profondeur des recherhes à partir de solution aléatoires.
     Dans le cas ou l'implémentation prend plus de 2 minutes, ce nombre de recherches peut être diminué.
-    Le nombre choisi devrait néanmoins respecter la contrainte de temps.
+    Le nombre choisi devrait néanmoins respecter la contrainte de temps. Le paramètre time_limit de solve() permet
+    aussi de fixer directement cette durée : les recherches sont alors relancées jusqu'à l'échéance.
     ...
 """
 
-def solve(problem: UFLP) -> Tuple[List[int], List[int]]:
+def solve(problem: UFLP, n_workers=1, seed=None, time_limit=None, callback=None, neighbourhood="best", gap_tolerance=None,
+          gap_callback=None, warm_start=None, checkpoint=None) -> Tuple[List[int], List[int]]:
     """
     Votre implementation, doit resoudre le probleme via recherche locale.
 
     Args:
         problem (UFLP): L'instance du probleme à résoudre
+        n_workers (int): nombre de processus pour les recherches aléatoires (None pour le nombre de CPU)
+        seed (int): graine des recherches aléatoires, pour des résultats reproductibles
+        time_limit (float): durée maximale en secondes. Les recherches aléatoires sont alors relancées (sans limite
+            de profondeur) jusqu'à l'échéance et la meilleure solution trouvée est retournée
+        callback (callable): appelée à chaque amélioration comme callback(elapsed, cost, solution), elapsed en secondes
+        neighbourhood (str): exploration du voisinage par les recherches locales, "best", "first" ou "random" (voir local_search)
+        gap_tolerance (float): si donné, une borne inférieure lagrangienne est calculée (voir bounds.py) : la recherche
+            s'arrête dès que l'écart relatif (cout - borne) / cout est inférieur à gap_tolerance, et les stations fixées
+            par les coûts réduits de la borne ne sont plus modifiées par les recherches aléatoires. Matrice dense uniquement :
+            ValueError avec le modèle creux (sparse_k)
+        gap_callback (callable): appelée comme gap_callback(elapsed, lower_bound, cost, gap) après le calcul de la borne
+            et à chaque amélioration
+        warm_start (Tuple[List[int], List[int]]): solution précédente, par exemple avant une modification de l'instance
+            (UFLP.add_satellite_stations, set_opening_costs, forbid_main_stations...). Elle est réparée (stations interdites
+            fermées, satellites réassignés) puis une recherche locale part de celle-ci à la place des deux recherches
+            initiales. Sans time_limit elle est retournée directement, sinon les recherches aléatoires suivent
+        checkpoint (checkpoint.Checkpoint): sauvegarde périodique de l'état de la recherche (meilleure solution, graine et
+            nombre de recherches aléatoires terminées, borne). Avec checkpoint.resume, une recherche interrompue reprend
+            là où elle en était et donne le même résultat qu'une exécution sans interruption (sans time_limit, qui
+            dépend du temps écoulé). Les sauvegardes ont lieu après les recherches initiales (et la borne), puis entre
+            deux recherches aléatoires au plus toutes les checkpoint.interval secondes : une recherche locale en cours
+            (recherches initiales comprises) n'est pas sauvegardée et recommence depuis son début à la reprise
+
+    Les stations interdites (coût d'ouverture infini) ne sont jamais ouvertes.
 
     Returns:
         Tuple[List[int], List[int]]: 
         La premiere valeur est une liste représentant les stations principales ouvertes au format [0, 1, 0] qui indique que seule la station 1 est ouverte
         La seconde valeur est une liste représentant les associations des stations satellites au format [1 , 4] qui indique que la premiere station est associée à la station pricipale d'indice 1 et la deuxieme à celle d'indice 4
     """
+    if gap_tolerance is not None and problem.connection_cost_matrix is None:
+        raise ValueError("gap_tolerance needs the full distance matrix, not the sparse cost model")
+    start_time = time.time()
+    state = None
+    if checkpoint is not None:
+        config = {"strategy": "advanced", "instance": problem.instance_name, "instance_digest": instance_digest(problem),
+                  "n_main_station": problem.n_main_station, "n_satellite_station": problem.n_satellite_station, "seed": seed, "time_limit": time_limit,
+                  "neighbourhood": neighbourhood, "gap_tolerance": gap_tolerance, "warm_start": warm_start is not None}
+        state = checkpoint.restore(config)
+        if state is not None:
+            # the time spent before the interruption counts in the time limit
+            start_time -= state["elapsed"]
+            seed = state["seed"]
+        elif seed is None:
+            # the seed of the restarts is saved to run the same ones after a resume
+            seed = np.random.SeedSequence().entropy
+    deadline = None if time_limit is None else start_time + time_limit
+    def report(cost, sol):
+        if callback is not None:
+            callback(time.time() - start_time, cost, sol)
+
     # number of local searches with a random inital solution and their depth
     nbr_random_local_searchs = 25
     depth_random_local_search = 40 # sufficient to find the minimum of the local searchs (all 3 instances)
+    if deadline is not None:
+        # restarts until the deadline, each search goes down to its local minimum
+        nbr_random_local_searchs = None
+        depth_random_local_search = None
     
-    # first local search with forced intial solution (beats secret agent)
-    sol = local_search(problem, depth=15, initial_solution=cheap_solution_1)
-    cost = problem.calculate_cost(sol[0],sol[1])
-    # second local search with another forced intial solution (also beats secret agent)
-    new_sol = local_search(problem, depth=15, initial_solution=cheap_solution_2)
-    new_cost = problem.calculate_cost(new_sol[0],new_sol[1])
-    # select solution with lowest cost
-    if new_cost<cost:
-            sol = new_sol
-            cost = new_cost
-    # n local search with random initial solution (diversification, also beats secret agent)
-    for i in range(nbr_random_local_searchs):
-        # new solution with local search
-        new_sol = local_search(problem, depth=depth_random_local_search, initial_solution=random_solution)
+    # order of the moves of the "random" neighbourhood for the two first searches
+    rng = np.random.default_rng(seed)
+    # forbidden stations stay closed in every local search
+    forbidden = problem.forbidden_main_stations
+    fixed = (np.zeros(problem.n_main_station, dtype=bool), forbidden) if forbidden.any() else None
+    if state is not None:
+        # resumed run : the initial searches and the restarts already done are in the best solution saved
+        cost, sol = state_solution(state, problem.n_main_station)
+        report(cost, sol)
+        if state["finished"]:
+            return sol
+    elif warm_start is not None:
+        # re-optimization of the previous solution after an update of the instance
+        sol = local_search(problem, depth=None, initial_solution=partial(repair_solution, solution=warm_start), deadline=deadline,
+                           neighbourhood=neighbourhood, rng=rng, fixed=fixed)
+        cost = problem.calculate_cost(sol[0],sol[1])
+        report(cost, sol)
+        if deadline is None:
+            return sol
+    else:
+        # first local search with forced intial solution (beats secret agent)
+        sol = local_search(problem, depth=15, initial_solution=cheap_solution_1, deadline=deadline, neighbourhood=neighbourhood, rng=rng, fixed=fixed)
+        cost = problem.calculate_cost(sol[0],sol[1])
+        report(cost, sol)
+        # second local search with another forced intial solution (also beats secret agent)
+        new_sol = local_search(problem, depth=15, initial_solution=cheap_solution_2, deadline=deadline, neighbourhood=neighbourhood, rng=rng, fixed=fixed)
         new_cost = problem.calculate_cost(new_sol[0],new_sol[1])
         # select solution with lowest cost
         if new_cost<cost:
-            sol = new_sol
-            cost = new_cost
+                sol = new_sol
+                cost = new_cost
+                report(cost, sol)
+
+    # lower bound : stop when the gap is small enough, fix stations with the reduced costs
+    stop = None
+    lower_bound = None
+    if state is not None:
+        if "lower_bound" in state:
+            lower_bound = state["lower_bound"]
+            fixed = (state["fixed_open"], state["fixed_closed"])
+    elif gap_tolerance is not None:
+        bound = lagrangian_bound(problem, upper_bound=cost, gap_tolerance=gap_tolerance, deadline=deadline)
+        if bound.solution is not None and bound.upper_bound < cost:
+            sol, cost = bound.solution, bound.upper_bound
+            report(cost, sol)
+        lower_bound = bound.lower_bound
+        fixed_open, fixed_closed = bound.fixed_stations(cost)
+        fixed = (fixed_open, fixed_closed | forbidden)
+    if lower_bound is not None:
+        def report_gap(cost):
+            if gap_callback is not None:
+                gap_callback(time.time() - start_time, lower_bound, cost, optimality_gap(cost, lower_bound))
+        report_gap(cost)
+        if optimality_gap(cost, lower_bound) <= gap_tolerance:
+            return sol
+        stop = lambda cost: optimality_gap(cost, lower_bound) <= gap_tolerance
+        previous_report = report
+        def report(cost, sol):
+            previous_report(cost, sol)
+            report_gap(cost)
+
+    # periodic checkpoints : best solution, number of restarts done (in order) and what the restarts depend on
+    def save_checkpoint(n_restarts_done, best, finished=False):
+        checkpoint_state = {"seed": seed, "restarts": n_restarts_done, "finished": finished, "elapsed": time.time() - start_time}
+        checkpoint_state.update(solution_state(*best))
+        if lower_bound is not None:
+            checkpoint_state.update(lower_bound=lower_bound, fixed_open=fixed[0], fixed_closed=fixed[1])
+        checkpoint.save(config, checkpoint_state)
+    on_progress = None
+    first_restart = 0
+    if checkpoint is not None:
+        first_restart = state["restarts"] if state is not None else 0
+        if state is None:
+            save_checkpoint(0, (cost, sol))
+        on_progress = lambda n_restarts_done, best: save_checkpoint(n_restarts_done, best) if checkpoint.due() else None
+
+    # n local search with random initial solution (diversification, also beats secret agent)
+    # spread over n_workers processes, each search has its own seed
+    cost, sol = run_multistart(problem, partial(random_restart, depth=depth_random_local_search, deadline=deadline,
+                                                         neighbourhood=neighbourhood, fixed=fixed),
+                               nbr_random_local_searchs, n_workers=n_workers, seed=seed, deadline=deadline,
+                               best=(cost, sol), on_improvement=report, stop=stop, first_restart=first_restart,
+                               on_progress=on_progress)
+    if checkpoint is not None:
+        save_checkpoint(None, (cost, sol), finished=True)
     return sol
 
-def local_search(problem: UFLP, depth, initial_solution):
+def random_restart(problem: UFLP, seed, depth, deadline=None, neighbourhood="best", fixed=None):
+    """Local search from a random initial solution generated with its own seed.
+
+    The descents are memoized in the evaluation cache of the instance, shared by the restarts of the process.
+
+    Returns : (cost, solution) of the local search
+    """
+    rng = np.random.default_rng(seed)
+    cache = problem.get_evaluation_cache()
+    sol = local_search(problem, depth=depth, initial_solution=partial(random_solution, rng=rng), deadline=deadline,
+                       neighbourhood=neighbourhood, rng=rng, fixed=fixed, cache=cache)
+    # the cost of a memoized end of descent is in the cache
+    entry = cache.peek(EvaluationCache.key(sol[0]))
+    if entry is not None and entry[0] == 0:
+        return entry[2], sol
+    return problem.calculate_cost(sol[0],sol[1]), sol
+
+def local_search(problem: UFLP, depth, initial_solution, deadline=None, neighbourhood="best", rng=None, fixed=None, cache=None):
     """Local search with a choice in the initial solution and the depth of the search.
+    The neighbours are evaluated incrementally (see evaluator.make_evaluator).
 
     Args : problem (UFLP): Instance of the problem
-    depth : depth of the search (number of times neighbours are generated)
+    depth : depth of the search (number of times neighbours are generated), None to search until a local minimum
     initial_solution : function generating the initial solution (optimized or random)
+    deadline : time.time() at which the search stops and returns its current solution (optional)
+    neighbourhood : "best" applies the best move of the whole neighbourhood (one vectorized pass),
+        "first" the first improving move in index order (the scan goes on after the last move applied),
+        "random" the first improving move in a random order. "first" and "random" evaluate the moves one by one
+        from neighbour_moves, without building the neighbourhood.
+    rng : np.random.Generator of the "random" neighbourhood
+    fixed : (fixed_open, fixed_closed) bool vectors of the main stations forced opened / closed (e.g. by bounds.py),
+        applied to the initial solution and never moved
+    cache : EvaluationCache memoizing the "best" descents without fixed stations. Each configuration of a finished
+        descent is stored as (number of moves to the end, end is a local minimum, cost, bit-packed opened stations)
+        of the end of the descent, a later descent reaching one of them returns that end directly when it would have
+        reached it too (same moves, same result, without evaluating the neighbourhoods again). The association of
+        the end is not stored, the satellite stations are assigned again to their nearest opened station
     """
-    # initial solution and cost
+    # initial solution
     sol = initial_solution(problem)
-    cost = problem.calculate_cost(sol[0],sol[1])
+    mains = np.asarray(sol[0], dtype=np.int32)
+    if depth is None:
+        depth = math.inf
+    frozen = None
+    if fixed is not None:
+        fixed_open, fixed_closed = fixed
+        mains[fixed_open] = 1
+        mains[fixed_closed] = 0
+        frozen = fixed_open | fixed_closed
+    if not mains.any():
+        # no station opened (infinite cost) : every neighbour opens one station, take the best one
+        if depth == 0:
+            return sol
+        single_costs = problem.main_stations_opening_cost_array + problem.total_connection_costs()
+        if fixed is not None:
+            single_costs[fixed[1]] = np.inf
+        mains[np.argmin(single_costs)] = 1
+        depth -= 1
+    evaluator = make_evaluator(problem, mains, frozen)
+    if neighbourhood == "best":
+        select_move = best_improvement
+    elif neighbourhood in ("first", "random"):
+        select_move = partial(first_improvement, order="random" if neighbourhood == "random" else "index",
+                              rng=rng if rng is not None else np.random.default_rng())
+    else:
+        raise ValueError("Unknown neighbourhood: %s" % neighbourhood)
+    # only the best improvement descents are deterministic
+    if neighbourhood != "best" or frozen is not None:
+        cache = None
+    path = []
     # n-search in neighbours and selection
-    for i in range(depth):
-        solution_changed = False  # Flag to track if a better solution has been found in the neighbours
-        # explore neighbour solutions
-        neighbours = create_neighbours(problem, sol)
-        # select solution with lowest cost
-        for neigh in neighbours:
-            new_cost = problem.calculate_cost(neigh[0],neigh[1])
-            if new_cost < cost:
-                sol = neigh
-                cost = new_cost
-                solution_changed = True
+    i = 0
+    start = 0
+    local_minimum = False
+    while i < depth and (deadline is None or time.time() < deadline):
+        if cache is not None:
+            key = EvaluationCache.key(evaluator.opened)
+            entry = cache.get(key)
+            if entry is not None and (entry[0] == depth - i or (entry[1] and entry[0] <= depth - i)):
+                # already visited : the descent ends like the previous one
+                _memoize_descent(cache, path, entry)
+                opened = np.unpackbits(entry[3], count=problem.n_main_station).astype(np.int32)
+                return opened.tolist(), assign_nearest_mains(problem, opened)
+            path.append(key)
+        move = select_move(evaluator, start=start)
         # If no better neighbour is found, terminate the search
-        if not solution_changed:
+        if move is None:
+            local_minimum = True
             break
+        evaluator.flip(move)
+        start = move + 1
+        i += 1
+    sol = evaluator.solution()
+    if cache is not None and (local_minimum or i >= depth):
+        if not local_minimum:
+            path.append(EvaluationCache.key(evaluator.opened))
+        end = (0, local_minimum, problem.calculate_cost(sol[0], sol[1]), np.packbits(evaluator.opened))
+        cache.put(path.pop(), end)
+        _memoize_descent(cache, path, end)
     return sol
 
+def _memoize_descent(cache: EvaluationCache, path, end) -> None:
+    """Store the configurations of a descent (in order of visit) leading to the cache entry end"""
+    n_moves, local_minimum, cost, opened = end
+    for i, key in enumerate(path):
+        cache.put(key, (n_moves + len(path) - i, local_minimum, cost, opened))
+
+def best_improvement(evaluator, start=0):
+    """Best improving move of the neighbourhood (evaluated in one pass), None at a local minimum"""
+    # evaluate all neighbour solutions (one station more or less)
+    deltas = evaluator.all_deltas()
+    best = int(np.argmin(deltas))
+    if not deltas[best] < 0:
+        return None
+    return best
+
+def first_improvement(evaluator, start=0, order="index", rng=None):
+    """First improving move, the moves being generated and evaluated one at a time, None at a local minimum
+
+    Args : evaluator : incremental evaluator of the current solution
+    start : first station of the scan in index order (the scan wraps around)
+    order : "index" or "random"
+    rng : np.random.Generator of the random order
+    """
+    n = len(evaluator.opened)
+    if order == "random":
+        stations = rng.permutation(n)
+    else:
+        stations = np.roll(np.arange(n), -(start % n)) if n else np.arange(0)
+    for station, _ in neighbour_moves(evaluator.opened, stations):
+        if evaluator.delta(station) < 0:
+            return station
+    return None
+
 def cheap_solution_1(problem: UFLP):
     """Creation of a specific initital solution :
     Opening only one main station with cheapest opening cost"""
     main_stations = np.zeros(problem.n_main_station, dtype=np.int32) # no opened main station 
     # Opening the cheapest one
-    cheap_indice = np.argmin(problem.main_stations_opening_cost)
+    cheap_indice = np.argmin(problem.main_stations_opening_cost_array)
     main_stations[cheap_indice] = 1
     # Assign satellites to that main station
     satellites = np.zeros(problem.n_satellite_station, dtype=np.int32) + cheap_indice 
@@ -104,7 +336,7 @@ def cheap_solution_2(problem: UFLP):
     # Number of main stations to open (approximately 1/4 of total)
     num_main_stations_to_open = max(1, problem.n_main_station // 4)  # At least 1 station should be open
     # Sort main stations by opening cost
-    sorted_indices = np.argsort(problem.main_stations_opening_cost)
+    sorted_indices = np.argsort(problem.main_stations_opening_cost_array)
     # Open the first num_main_stations_to_open stations with the lowest opening cost
     main_stations = np.zeros(problem.n_main_station, dtype=np.int32)
     main_stations[sorted_indices[:num_main_stations_to_open]] = 1
@@ -113,16 +345,49 @@ def cheap_solution_2(problem: UFLP):
     
     return main_stations.tolist(), satellites
 
-def random_solution(problem: UFLP):
+def repair_solution(problem: UFLP, solution):
+    """Previous solution adapted to the current instance : its forbidden main stations are closed and the satellite
+    stations (possibly added or removed since) are assigned to their nearest opened main station"""
+    main_stations = np.array(solution[0], dtype=np.int32)
+    if len(main_stations) != problem.n_main_station:
+        raise ValueError("The solution has %d main stations, the instance %d" % (len(main_stations), problem.n_main_station))
+    main_stations[problem.forbidden_main_stations] = 0
+    satellites = assign_nearest_mains(problem, main_stations)
+
+    return main_stations.tolist(), satellites
+
+def random_solution(problem: UFLP, rng=None):
     """Creation of a random initital solution :
-    Opening random main stations to indroduce diversification."""
+    Opening random main stations to indroduce diversification.
+    rng : optional np.random.Generator (global numpy random state otherwise)"""
     # Create a random array of 4 digits (0 or 1)
-    main_stations = np.random.randint(2, size=problem.n_main_station, dtype=np.int32)
+    if rng is None:
+        main_stations = np.random.randint(2, size=problem.n_main_station, dtype=np.int32)
+    else:
+        main_stations = rng.integers(2, size=problem.n_main_station, dtype=np.int32)
     # Assign satellites to the nearest main station
     satellites = assign_nearest_mains(problem, main_stations)
     
     return main_stations.tolist(), satellites
 
+def neighbour_moves(main_stations, stations=None):
+    """Lazy neighbourhood : yield the moves (station index, +1 to open it or -1 to close it) instead of solutions.
+    The last opened station is never closed.
+
+    Args : main_stations : 0/1 or bool vector of the opened main stations (read while iterating)
+    stations : order of the stations (index order by default)
+    """
+    main_stations = np.asarray(main_stations)
+    can_close = np.count_nonzero(main_stations) > 1
+    if stations is None:
+        stations = range(len(main_stations))
+    for station in stations:
+        station = int(station)
+        if not main_stations[station]:
+            yield station, 1
+        elif can_close:
+            yield station, -1
+
 def create_neighbours(problem: UFLP, sol):
     """Generate other solutions by changing the number of main stations.
     Adding or removing one main station if it's possible.
@@ -148,21 +413,17 @@ def create_neighbours(problem: UFLP, sol):
     return neighbours
 
 def assign_nearest_mains(problem, main_stations):
-    """Assign sattelites to the nearest main station"""
-    satellites = []
-    # for all sattelites stations
-    for sat_coord in problem.satellite_stations_connection_coordinates:
-        min_distance = float('inf')
-        closest_main = None
-        i = 0
-        # for all main stations
-        for main_coord in problem.main_stations_coordinates:
-            if main_stations[i] == 1: # check if main station is opened
-                # calculate distance and keep the nearest main station 
-                distance = problem.coordinates_to_cost(sat_coord[0],sat_coord[1],main_coord[0],main_coord[1]) 
-                if distance < min_distance:
-                    min_distance = distance
-                    closest_main = i
-            i += 1
-        satellites.append(closest_main)
-    return satellites
+    """Assign sattelites to the nearest main station (lowest index on ties, None if no station is opened).
+    Dense instances read the rows of the opened stations in the distance matrix, sparse ones query the spatial
+    index of the main stations."""
+    main_stations = np.asarray(main_stations).astype(bool)
+    if not main_stations.any():
+        return [None] * problem.n_satellite_station
+    if problem.connection_cost_matrix is not None:
+        # opened stations are sorted, argmin keeps the lowest index on ties
+        opened = np.flatnonzero(main_stations)
+        return opened[np.argmin(problem.connection_cost_matrix[opened], axis=0)].tolist()
+    index = problem.get_spatial_index()
+    index.set_opened(main_stations)
+    satellites, _ = index.nearest_many(problem.satellite_stations_coordinates_array)
+    return satellites.tolist()
@@ -0,0 +1,226 @@
+import math
+import numpy as np
+
+class StationGrid():
+    """Uniform grid over the main stations answering "nearest opened station" queries.
+
+    Stations are bucketed by cell (CSR layout : stations sorted by cell and offset of each cell), the number of
+    opened stations of each cell is maintained when stations are opened or closed. A query looks at the cells
+    around the point ring by ring (bands of doubling width) and stops as soon as no farther cell can hold a closer station, so it only
+    reads the stations close to the point instead of all of them. All the points are searched together, band by band.
+    """
+
+    def __init__(self, coordinates, cell_size=None, stations_per_cell=2.0, linear_threshold=128) -> None:
+        """
+        Args:
+            coordinates (array-like): coordinates of the main stations, shape (n, 2)
+            cell_size (float): side of the cells (default : about stations_per_cell stations per cell)
+            stations_per_cell (float): average number of stations per cell used for the default cell size
+            linear_threshold (int): queries scan the opened stations directly when at most linear_threshold stations
+                are opened (measured crossover)
+        """
+        self.coordinates = np.ascontiguousarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        self.n_station = len(self.coordinates)
+        self.linear_threshold = linear_threshold
+        self.origin = self.coordinates.min(axis=0) if self.n_station else np.zeros(2)
+        extent = (self.coordinates.max(axis=0) - self.origin) if self.n_station else np.ones(2)
+        if cell_size is None:
+            n_cells = max(self.n_station / stations_per_cell, 1.0)
+            # about n_cells cells, and at most about n_cells along the largest side (collinear stations)
+            cell_size = max(math.sqrt(extent[0] * extent[1] / n_cells), extent.max() / n_cells)
+        self.cell_size = max(float(cell_size), 1e-9)
+        self.shape = tuple(int(n) for n in np.floor(extent / self.cell_size).astype(np.int64) + 1)
+        cells = self._cell_ids(self.coordinates)
+        # CSR layout : stations of cell c are order[cell_start[c]:cell_start[c+1]]
+        self.order = np.argsort(cells, kind='stable')
+        self.cell_start = np.zeros(self.shape[0] * self.shape[1] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=self.shape[0] * self.shape[1]), out=self.cell_start[1:])
+        self.station_cell = cells
+        self.opened = np.zeros(self.n_station, dtype=bool)
+        self.open_count = np.zeros(self.shape[0] * self.shape[1], dtype=np.int64)
+
+    def _cell_xy(self, points: np.ndarray) -> np.ndarray:
+        """Cell coordinates of points, clamped to the grid"""
+        xy = np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+        return np.clip(xy, 0, np.array(self.shape) - 1)
+
+    def _cell_ids(self, points: np.ndarray) -> np.ndarray:
+        xy = self._cell_xy(points)
+        return xy[:, 0] * self.shape[1] + xy[:, 1]
+
+    @property
+    def n_opened(self) -> int:
+        return int(self.open_count.sum())
+
+    def set_opened(self, main_stations_opened) -> None:
+        """Set the state of every station from a 0/1 vector"""
+        self.opened = np.asarray(main_stations_opened).astype(bool).copy()
+        self.open_count = np.bincount(self.station_cell[self.opened], minlength=len(self.open_count))
+
+    def open(self, main_station: int) -> None:
+        if not self.opened[main_station]:
+            self.opened[main_station] = True
+            self.open_count[self.station_cell[main_station]] += 1
+
+    def close(self, main_station: int) -> None:
+        if self.opened[main_station]:
+            self.opened[main_station] = False
+            self.open_count[self.station_cell[main_station]] -= 1
+
+    def nearest(self, x: float, y: float):
+        """Nearest opened station of a point (lowest index on ties)
+
+        Returns:
+            Tuple[int, float]: index of the station and distance, (-1, inf) if no station is opened
+        """
+        indices, distances = self.nearest_many(np.array([[x, y]]))
+        return int(indices[0]), float(distances[0])
+
+    def nearest_many(self, points) -> tuple:
+        """Nearest opened station of each point (lowest index on ties)
+
+        Args:
+            points (array-like): coordinates of the points, shape (m, 2)
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: index of the nearest opened station of each point (-1 if none) and distances
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        indices = np.full(len(points), -1, dtype=np.int64)
+        distances = np.full(len(points), np.inf)
+        n_opened = self.n_opened
+        if n_opened == 0:
+            return indices, distances
+        if n_opened <= self.linear_threshold:
+            return self._nearest_linear(points)
+        for rows, stations, d in self._search(points, opened_only=True, done=lambda active, beyond: distances[active] < beyond):
+            # pairs are grouped by point : closest station of each point, lowest index on ties
+            starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+            lowest = np.minimum.reduceat(d, starts)
+            closest = np.where(d == np.repeat(lowest, np.diff(np.r_[starts, len(rows)])), stations, self.n_station)
+            rows, stations, d = rows[starts], np.minimum.reduceat(closest, starts), lowest
+            better = (d < distances[rows]) | ((d == distances[rows]) & (stations < indices[rows]))
+            indices[rows[better]] = stations[better]
+            distances[rows[better]] = d[better]
+        return indices, distances
+
+    def stations_within(self, points, radii) -> tuple:
+        """Every station, opened or not, closer to a point than the radius of the point
+
+        Args:
+            points (array-like): coordinates of the points, shape (m, 2)
+            radii (array-like): radius of each point
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: index of the point and index of the station of each pair found
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        radii = np.asarray(radii, dtype=np.float64)
+        point_parts, station_parts = [], []
+        for rows, stations, d in self._search(points, opened_only=False, done=lambda active, beyond: radii[active] <= beyond):
+            close = d < radii[rows]
+            point_parts.append(rows[close])
+            station_parts.append(stations[close])
+        if not point_parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(point_parts), np.concatenate(station_parts)
+
+    def _nearest_linear(self, points: np.ndarray, chunk_size=4096):
+        """Scan of all the opened stations, by chunks of points"""
+        candidates = np.flatnonzero(self.opened)
+        coordinates = self.coordinates[candidates]
+        indices = np.empty(len(points), dtype=np.int64)
+        distances = np.empty(len(points))
+        for start in range(0, len(points), chunk_size):
+            chunk = points[start:start + chunk_size]
+            d = np.hypot(chunk[:, np.newaxis, 0] - coordinates[np.newaxis, :, 0], chunk[:, np.newaxis, 1] - coordinates[np.newaxis, :, 1])
+            # candidates are sorted, argmin keeps the lowest index on ties
+            best = np.argmin(d, axis=1)
+            indices[start:start + chunk_size] = candidates[best]
+            distances[start:start + chunk_size] = d[np.arange(len(chunk)), best]
+        return indices, distances
+
+    def _search(self, points: np.ndarray, opened_only: bool, done, pair_budget=1 << 22):
+        """Search of the stations around the points, by bands of rings of cells of doubling width (rings 0, 1-2, 3-6..)
+
+        All the points still searched are handled together for each band. After a band, a point is no longer searched
+        when done(indices of the searched points, lower bound of their distance to the stations beyond the band) is
+        True for it.
+
+        Args:
+            opened_only (bool): only look at the opened stations
+            pair_budget (int): number of (point, cell) pairs handled at once
+
+        Yields:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: point, station and distance of the pairs found in a band,
+                grouped by point
+        """
+        stations = np.flatnonzero(self.opened) if opened_only else np.arange(self.n_station)
+        if len(stations) == 0:
+            return
+        # cells and bounding box of the stations looked for : the rings outside them are skipped
+        station_x, station_y = self.station_cell[stations] // self.shape[1], self.station_cell[stations] % self.shape[1]
+        box = (int(station_x.min()), int(station_x.max()), int(station_y.min()), int(station_y.max()),
+               self.coordinates[stations].min(axis=0), self.coordinates[stations].max(axis=0))
+        cells = self._cell_xy(points)
+        active = np.arange(len(points))
+        first, width = 0, 1
+        while len(active) and first < max(self.shape):
+            last = first + width - 1
+            dx, dy = self._band_offsets(first, last)
+            chunk_size = max(1, pair_budget // max(len(dx), 1))
+            for start in range(0, len(active), chunk_size):
+                chunk = active[start:start + chunk_size]
+                rows, stations = self._band_pairs(cells[chunk], dx, dy, opened_only)
+                if len(stations):
+                    rows = chunk[rows]
+                    d = np.hypot(points[rows, 0] - self.coordinates[stations, 0], points[rows, 1] - self.coordinates[stations, 1])
+                    yield rows, stations, d
+            active = active[~done(active, self._beyond_distance(points[active], cells[active], last, box))]
+            first, width = last + 1, 2 * width
+
+    def _band_offsets(self, first: int, last: int):
+        """Offsets (dx, dy) of the cells at Chebyshev distance first to last of a cell, within the size of the grid"""
+        x_reach, y_reach = min(last, self.shape[0] - 1), min(last, self.shape[1] - 1)
+        dx = np.arange(-x_reach, x_reach + 1)[:, np.newaxis]
+        dy = np.arange(-y_reach, y_reach + 1)[np.newaxis, :]
+        ring = np.maximum(np.abs(dx), np.abs(dy))
+        dx, dy = np.broadcast_arrays(dx, dy)
+        return dx[ring >= first], dy[ring >= first]
+
+    def _band_pairs(self, cells: np.ndarray, dx: np.ndarray, dy: np.ndarray, opened_only: bool):
+        """Pairs (row of the point, station) of the stations of the cells at offsets (dx, dy) of the cells of the points"""
+        nx, ny = self.shape
+        x = cells[:, 0, np.newaxis] + dx
+        y = cells[:, 1, np.newaxis] + dy
+        rows, columns = np.nonzero((x >= 0) & (x < nx) & (y >= 0) & (y < ny))
+        cell_ids = x[rows, columns] * ny + y[rows, columns]
+        starts, lengths = self.cell_start[cell_ids], self.cell_start[cell_ids + 1] - self.cell_start[cell_ids]
+        if opened_only:
+            lengths = np.where(self.open_count[cell_ids] > 0, lengths, 0)
+        # concatenation of the CSR slices of the cells
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        rows, stations = np.repeat(rows, lengths), self.order[offsets]
+        if opened_only:
+            opened = self.opened[stations]
+            rows, stations = rows[opened], stations[opened]
+        return rows, stations
+
+    def _beyond_distance(self, points: np.ndarray, cells: np.ndarray, r: int, box: tuple) -> np.ndarray:
+        """Lower bound of the distance from each point to the stations of a box (x_min, x_max, y_min, y_max of its
+        cells, lowest and highest coordinates of its stations) beyond the ring r around the cell of the point :
+        distance to the strips of the box outside the rings 0 to r, clipped to the coordinates of the stations"""
+        x_min, x_max, y_min, y_max, low, high = box
+        cx, cy = cells[:, 0], cells[:, 1]
+        inner_x = (np.maximum(cx - r, x_min), np.minimum(cx + r, x_max))
+        strips = [((x_min, cx - r - 1), (y_min, y_max)), ((cx + r + 1, x_max), (y_min, y_max)),
+                  (inner_x, (y_min, cy - r - 1)), (inner_x, (cy + r + 1, y_max))]
+        distance = np.full(len(points), np.inf)
+        for (x0, x1), (y0, y1) in strips:
+            gap_x = np.maximum(np.maximum(np.maximum(self.origin[0] + self.cell_size * x0, low[0]) - points[:, 0],
+                                          points[:, 0] - np.minimum(self.origin[0] + self.cell_size * (np.asarray(x1) + 1), high[0])), 0.0)
+            gap_y = np.maximum(np.maximum(np.maximum(self.origin[1] + self.cell_size * y0, low[1]) - points[:, 1],
+                                          points[:, 1] - np.minimum(self.origin[1] + self.cell_size * (np.asarray(y1) + 1), high[1])), 0.0)
+            empty = (np.asarray(x0) > x1) | (np.asarray(y0) > y1)
+            distance = np.minimum(distance, np.where(empty, np.inf, np.hypot(gap_x, gap_y)))
+        return distance
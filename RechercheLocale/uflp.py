@@ -1,37 +1,217 @@
 import math
 from typing import List
-import matplotlib.pyplot as plt
 import numpy as np
+from spatial_index import StationGrid
+from evaluation_cache import EvaluationCache
+from instance_io import load_instance_arrays, load_distance_matrix
 
 class UFLP():
 
-    def __init__(self,instance_name : str) -> None:
+    def __init__(self,instance_name : str, sparse_k: int = None, use_cache: bool = True, cache_distance_matrix: bool = False) -> None:
+        """
+        Args:
+            instance_name (str): name of the instance to load, no extension needed and should be in the instances folder
+            sparse_k (int): if given, only the sparse_k nearest main stations of each satellite station are stored
+                instead of the full distance matrix (see build_sparse_cost_model)
+            use_cache (bool): read and write the binary cache of the instance file
+            cache_distance_matrix (bool): also cache the distance matrix (memory-mapped when read back)
+        """
         self.instance_name = instance_name
+        self.sparse_k = sparse_k
+        self.use_cache = use_cache
+        self.cache_distance_matrix = cache_distance_matrix
         self.load_instance(instance_name)
 
+    @classmethod
+    def from_arrays(cls, instance_name: str, main_stations_opening_cost, main_stations_coordinates, satellite_stations_coordinates, sparse_k: int = None,
+                    connection_cost_matrix=None) -> "UFLP":
+        """Create an instance directly from its data, without reading the instances folder
+
+        Args:
+            instance_name (str): name of the instance
+            main_stations_opening_cost (array-like): opening cost of each main station, shape (n_main_station,)
+            main_stations_coordinates (array-like): coordinates of the main stations, shape (n_main_station, 2)
+            satellite_stations_coordinates (array-like): coordinates of the satellite stations, shape (n_satellite_station, 2)
+            sparse_k (int): number of nearest main stations kept per satellite station, None for the full distance matrix
+            connection_cost_matrix (array-like): connection costs replacing the distances between the stations, shape
+                (n_main_station, n_satellite_station), as assigned to satellite_stations_connection_cost (optional)
+
+        Returns:
+            UFLP: the instance, with its cost model built
+        """
+        problem = cls.__new__(cls)
+        problem.instance_name = instance_name
+        problem.sparse_k = sparse_k
+        problem.use_cache = False
+        problem.cache_distance_matrix = False
+        problem.n_main_station = len(main_stations_opening_cost)
+        problem.n_satellite_station = len(satellite_stations_coordinates)
+        problem.main_stations_opening_cost = [float(c) for c in main_stations_opening_cost]
+        problem.main_stations_coordinates = [(float(x), float(y)) for x, y in main_stations_coordinates]
+        problem.satellite_stations_connection_coordinates = [(float(x), float(y)) for x, y in satellite_stations_coordinates]
+        problem.build_cost_model(connection_cost_matrix if sparse_k is None else None)
+        if connection_cost_matrix is not None:
+            problem.satellite_stations_connection_cost = connection_cost_matrix
+        return problem
+
     def load_instance(self,instance_name : str) -> None:
         """Load an instance from a file and set the attributes of the class
 
+        The file is parsed in bulk and cached in binary form next to it (see instance_io).
+
         Args:
             instance_name (str): name of the instance to load, no extension needed and should be in the instances folder
         """
-        self.main_stations_opening_cost = []
-        self.main_stations_coordinates = []
-        self.satellite_stations_connection_coordinates = []
-        self.satellite_stations_connection_cost = []
         filename = "instances/"+instance_name+".txt"
-        with open(filename, "r") as f:
-            lines = f.readlines()
-            self.n_main_station = int(lines[0].split(" ")[0])
-            self.n_satellite_station = int(lines[0].split(" ")[1])
-            for i in range(1,self.n_main_station+1):
-                line = lines[i].split(" ")
-                self.main_stations_opening_cost.append(float(line[2]))
-                self.main_stations_coordinates.append((float(line[0]),float(line[1])))
-            for i in range(self.n_main_station+1,self.n_main_station+self.n_satellite_station+1):
-                line = lines[i].split(" ")
-                self.satellite_stations_connection_coordinates.append((float(line[0]),float(line[1])))
-        self.satellite_stations_connection_cost = [[self.coordinates_to_cost(self.main_stations_coordinates[i][0],self.main_stations_coordinates[i][1],self.satellite_stations_connection_coordinates[j][0],self.satellite_stations_connection_coordinates[j][1]) for j in range(self.n_satellite_station)] for i in range(self.n_main_station)]
+        opening_cost, main_coordinates, satellite_coordinates = load_instance_arrays(filename, use_cache=self.use_cache)
+        self.n_main_station = len(opening_cost)
+        self.n_satellite_station = len(satellite_coordinates)
+        self.main_stations_opening_cost = opening_cost.tolist()
+        self.main_stations_coordinates = [tuple(c) for c in main_coordinates.tolist()]
+        self.satellite_stations_connection_coordinates = [tuple(c) for c in satellite_coordinates.tolist()]
+        connection_cost_matrix = None
+        if self.use_cache and self.cache_distance_matrix and self.sparse_k is None:
+            connection_cost_matrix = load_distance_matrix(filename, (self.n_main_station, self.n_satellite_station),
+                                                          lambda: self.coordinates_to_cost_matrix(main_coordinates, satellite_coordinates))
+        self.build_cost_model(connection_cost_matrix)
+
+    def build_cost_model(self, connection_cost_matrix: np.ndarray = None) -> None:
+        """Build the NumPy cost model from the coordinates and opening costs of the instance
+
+        The distance matrix is a contiguous float64 array of shape (n_main_station, n_satellite_station)
+        computed by broadcasting, the list based attribute satellite_stations_connection_cost is kept for
+        compatibility and is built from that matrix on first use. With sparse_k, the sparse cost model is built instead.
+
+        The arrays are the cost model read by every method and solver. The list attributes (main_stations_opening_cost,
+        main_stations_coordinates, satellite_stations_connection_coordinates, satellite_stations_connection_cost) are
+        read-only copies kept for compatibility : modifying them in place has no effect on the costs. The instance is
+        modified through set_opening_costs, forbid_main_stations, add_satellite_stations, remove_satellite_stations,
+        or by assigning a whole new satellite_stations_connection_cost.
+
+        Args:
+            connection_cost_matrix (np.ndarray): precomputed distance matrix (e.g. read from the cache), optional
+        """
+        self.main_stations_opening_cost_array = np.ascontiguousarray(self.main_stations_opening_cost, dtype=np.float64).reshape(self.n_main_station)
+        self.main_stations_coordinates_array = np.ascontiguousarray(self.main_stations_coordinates, dtype=np.float64).reshape(self.n_main_station, 2)
+        self.satellite_stations_coordinates_array = np.ascontiguousarray(self.satellite_stations_connection_coordinates, dtype=np.float64).reshape(self.n_satellite_station, 2)
+        self.spatial_index = None
+        self.evaluation_cache = None
+        self._connection_cost_lists = None
+        # True once connection costs not derived from the coordinates are assigned
+        self.custom_connection_costs = False
+        if self.sparse_k is not None:
+            self.build_sparse_cost_model(self.sparse_k)
+            return
+        if connection_cost_matrix is None:
+            connection_cost_matrix = self.coordinates_to_cost_matrix(self.main_stations_coordinates_array, self.satellite_stations_coordinates_array)
+        self.connection_cost_matrix = connection_cost_matrix
+
+    @property
+    def satellite_stations_connection_cost(self) -> List[List[float]]:
+        """Connection costs as nested lists [main_station][satellite_station], built from the distance matrix
+        on first use (None with the sparse cost model)"""
+        if self._connection_cost_lists is None and self.connection_cost_matrix is not None:
+            self._connection_cost_lists = self.connection_cost_matrix.tolist()
+        return self._connection_cost_lists
+
+    @satellite_stations_connection_cost.setter
+    def satellite_stations_connection_cost(self, connection_costs) -> None:
+        """Replace the connection costs, the distance matrix (dense cost model) is rebuilt from them"""
+        self.connection_cost_matrix = np.ascontiguousarray(connection_costs, dtype=np.float64).reshape(self.n_main_station, self.n_satellite_station)
+        self.custom_connection_costs = True
+        self._cost_model_updated()
+
+    def build_sparse_cost_model(self, k: int, chunk_size: int = None) -> None:
+        """Build the sparse cost model : the k nearest main stations of each satellite station and the reverse lists
+
+        The full matrix is never stored, distances are computed by chunks of satellite stations. Costs outside the
+        lists are computed exactly from the coordinates when needed (see connection_costs), and every main station
+        outside the list of a satellite station is at least candidate_radius[satellite] away.
+
+        Args:
+            k (int): number of nearest main stations kept per satellite station
+            chunk_size (int): number of satellite stations per chunk (default : about 2**22 distances per chunk)
+        """
+        k = max(1, min(k, self.n_main_station))
+        self.connection_cost_matrix = None
+        # candidate lists of the satellite stations, sorted by cost
+        self.candidate_mains, self.candidate_costs = self._candidate_lists(self.satellite_stations_coordinates_array, k, chunk_size)
+        self._build_reverse_candidate_lists()
+
+    def _candidate_lists(self, satellite_coordinates: np.ndarray, k: int, chunk_size: int = None):
+        """k nearest main stations of some satellite stations and their costs, sorted by cost (then by index)"""
+        if chunk_size is None:
+            chunk_size = max(1, 2**22 // max(self.n_main_station, 1))
+        candidate_mains = np.empty((len(satellite_coordinates), k), dtype=np.int32)
+        candidate_costs = np.empty((len(satellite_coordinates), k), dtype=np.float64)
+        for start in range(0, len(satellite_coordinates), chunk_size):
+            costs = self.coordinates_to_cost_matrix(satellite_coordinates[start:start + chunk_size], self.main_stations_coordinates_array)
+            if k < self.n_main_station:
+                nearest = np.argpartition(costs, k - 1, axis=1)[:, :k]
+            else:
+                nearest = np.broadcast_to(np.arange(k), costs.shape).copy()
+            nearest_costs = np.take_along_axis(costs, nearest, axis=1)
+            order = np.lexsort((nearest, nearest_costs), axis=1)
+            candidate_mains[start:start + chunk_size] = np.take_along_axis(nearest, order, axis=1)
+            candidate_costs[start:start + chunk_size] = np.take_along_axis(nearest_costs, order, axis=1)
+        return candidate_mains, candidate_costs
+
+    def _build_reverse_candidate_lists(self) -> None:
+        """Radius of the candidate lists and reverse lists of the main stations, from the candidate lists"""
+        k = self.candidate_mains.shape[1]
+        self.candidate_radius = self.candidate_costs[:, -1].copy()
+        # reverse lists (CSR) : satellite stations having main station i in their list are
+        # main_candidate_satellites[main_candidate_start[i]:main_candidate_start[i+1]]
+        flat_mains = self.candidate_mains.ravel()
+        order = np.argsort(flat_mains, kind='stable')
+        self.main_candidate_start = np.zeros(self.n_main_station + 1, dtype=np.int64)
+        np.cumsum(np.bincount(flat_mains, minlength=self.n_main_station), out=self.main_candidate_start[1:])
+        self.main_candidate_satellites = (order // k).astype(np.int32)
+        self.main_candidate_costs = self.candidate_costs.ravel()[order]
+        self.main_candidate_mains = flat_mains[order]
+
+    def connection_costs(self, main_stations, satellite_stations) -> np.ndarray:
+        """Get the exact connection costs between some main stations and some satellite stations, in both cost models
+
+        Args:
+            main_stations (array-like): indices of the main stations
+            satellite_stations (array-like): indices of the satellite stations
+
+        Returns:
+            np.ndarray: array of shape (len(main_stations), len(satellite_stations))
+        """
+        if self.connection_cost_matrix is not None:
+            return self.connection_cost_matrix[np.ix_(np.asarray(main_stations, dtype=np.intp), np.asarray(satellite_stations, dtype=np.intp))]
+        return self.coordinates_to_cost_matrix(self.main_stations_coordinates_array[main_stations], self.satellite_stations_coordinates_array[satellite_stations])
+
+    def total_connection_costs(self, chunk_size: int = None) -> np.ndarray:
+        """Get, for each main station, the sum of its connection costs to all the satellite stations
+
+        Returns:
+            np.ndarray: array of shape (n_main_station,)
+        """
+        if self.connection_cost_matrix is not None:
+            return self.connection_cost_matrix.sum(axis=1)
+        if chunk_size is None:
+            chunk_size = max(1, 2**22 // max(self.n_main_station, 1))
+        total = np.zeros(self.n_main_station)
+        for start in range(0, self.n_satellite_station, chunk_size):
+            total += self.connection_costs(np.arange(self.n_main_station), np.arange(start, min(start + chunk_size, self.n_satellite_station))).sum(axis=1)
+        return total
+
+    def coordinates_to_cost_matrix(self, main_coordinates: np.ndarray, satellite_coordinates: np.ndarray) -> np.ndarray:
+        """Calculate the cost of every connection between a set of main stations and a set of satellite stations
+
+        Args:
+            main_coordinates (np.ndarray): array of shape (n, 2) with the coordinates of the main stations
+            satellite_coordinates (np.ndarray): array of shape (m, 2) with the coordinates of the satellite stations
+
+        Returns:
+            np.ndarray: contiguous float64 array of shape (n, m), same values as coordinates_to_cost
+        """
+        dx = satellite_coordinates[np.newaxis, :, 0] - main_coordinates[:, np.newaxis, 0]
+        dy = satellite_coordinates[np.newaxis, :, 1] - main_coordinates[:, np.newaxis, 1]
+        return np.ascontiguousarray(np.sqrt(dx * dx + dy * dy), dtype=np.float64)
 
     
     def coordinates_to_cost(self, x1 :float , y1 : float, x2 : float, y2 :float) -> float:
@@ -55,17 +235,170 @@ class UFLP():
         """Calculate the cost of a solution
 
         Args:
-            main_stations_opened (List[int]): list of 0/1, 1 if the main station is opened, 0 otherwise
-            satellite_stations_associations (list[int]): list of the main station associated to each satellite station
+            main_stations_opened (List[int]): list (or array) of 0/1, 1 if the main station is opened, 0 otherwise
+            satellite_stations_associations (list[int]): list (or array) of the main station associated to each satellite station
 
         Returns:
             float: cost of the solution
         """
-        if sum(main_stations_opened) == 0: return math.inf
-        opening_cost = sum([main_stations_opened[i]*self.main_stations_opening_cost[i] for i in range(self.n_main_station)])
-        distance_cost = sum([self.satellite_stations_connection_cost[satellite_stations_association[i]][i] for i in range(len(satellite_stations_association))])
+        main_stations_opened = np.asarray(main_stations_opened)
+        if not main_stations_opened.any(): return math.inf
+        # closed stations are masked out : a forbidden station has an infinite opening cost (inf * 0 is nan)
+        opening_cost = float(np.where(main_stations_opened != 0, self.main_stations_opening_cost_array, 0.0) @ main_stations_opened)
+        distance_cost = float(self.get_association_costs(satellite_stations_association).sum())
         return opening_cost+distance_cost
+
+    def calculate_costs(self, main_stations_opened_population, chunk_size: int = None) -> np.ndarray:
+        """Calculate the cost of many solutions at once, each satellite station being assigned to its nearest opened station
+
+        The connection costs are a masked min over the distance matrix for every solution, computed by blocks of
+        solutions and of satellite stations holding at most chunk_size costs (distances computed from the
+        coordinates with the sparse cost model).
+
+        Args:
+            main_stations_opened_population (array-like): 0/1 or bool array of shape (n_solutions, n_main_station)
+            chunk_size (int): maximum number of costs per block (default 2**22)
+
+        Returns:
+            np.ndarray: cost of each solution, shape (n_solutions,), inf if no station is opened
+        """
+        population = np.asarray(main_stations_opened_population).astype(bool).reshape(-1, self.n_main_station)
+        if chunk_size is None:
+            chunk_size = 2**22
+        n_satellites = max(1, min(self.n_satellite_station, chunk_size // max(self.n_main_station, 1)))
+        n_solutions = max(1, chunk_size // max(self.n_main_station * n_satellites, 1))
+        # forbidden stations are masked out like in calculate_cost
+        costs = np.where(population, self.main_stations_opening_cost_array, 0.0).sum(axis=1)
+        for sat_start in range(0, self.n_satellite_station, n_satellites):
+            satellites = slice(sat_start, min(sat_start + n_satellites, self.n_satellite_station))
+            if self.connection_cost_matrix is not None:
+                connection_costs = self.connection_cost_matrix[:, satellites]
+            else:
+                connection_costs = self.coordinates_to_cost_matrix(self.main_stations_coordinates_array, self.satellite_stations_coordinates_array[satellites])
+            for start in range(0, len(population), n_solutions):
+                masks = population[start:start + n_solutions, :, np.newaxis]
+                costs[start:start + n_solutions] += np.where(masks, connection_costs, np.inf).min(axis=1).sum(axis=1)
+        costs[~population.any(axis=1)] = math.inf
+        return costs
+
+    def get_association_costs(self, satellite_stations_association) -> np.ndarray:
+        """Get the association cost of every satellite station for a given association
+
+        Args:
+            satellite_stations_association (list[int] | np.ndarray): main station associated to each satellite station
+
+        Returns:
+            np.ndarray: association cost of each satellite station to its main station
+        """
+        satellite_stations_association = np.asarray(satellite_stations_association, dtype=np.intp)
+        if self.connection_cost_matrix is None:
+            delta = self.satellite_stations_coordinates_array[:len(satellite_stations_association)] - self.main_stations_coordinates_array[satellite_stations_association]
+            return np.sqrt(delta[:, 0] * delta[:, 0] + delta[:, 1] * delta[:, 1])
+        return self.connection_cost_matrix[satellite_stations_association, np.arange(len(satellite_stations_association))]
     
+    def get_spatial_index(self) -> StationGrid:
+        """Get the spatial index of the main stations (built on first use)
+
+        Returns:
+            StationGrid: grid answering nearest opened main station queries, its opened stations are set by the caller
+        """
+        if getattr(self, "spatial_index", None) is None:
+            self.spatial_index = StationGrid(self.main_stations_coordinates_array)
+        return self.spatial_index
+
+    def get_evaluation_cache(self) -> EvaluationCache:
+        """Get the cache of the configurations evaluated by the solvers (created on first use, emptied when the
+        cost model is rebuilt)
+
+        Returns:
+            EvaluationCache: cache shared by the searches run on this instance in the current process
+        """
+        if getattr(self, "evaluation_cache", None) is None:
+            self.evaluation_cache = EvaluationCache()
+        return self.evaluation_cache
+
+    @property
+    def forbidden_main_stations(self) -> np.ndarray:
+        """Bool vector of the main stations that can not be opened (infinite opening cost)"""
+        return np.isinf(self.main_stations_opening_cost_array)
+
+    def add_satellite_stations(self, satellite_stations_coordinates) -> np.ndarray:
+        """Add satellite stations to the instance, only the connection costs of the new stations are computed
+
+        Args:
+            satellite_stations_coordinates (array-like): coordinates of the new satellite stations, shape (n, 2)
+
+        Returns:
+            np.ndarray: indices of the new satellite stations (after the existing ones)
+        """
+        coordinates = np.ascontiguousarray(satellite_stations_coordinates, dtype=np.float64).reshape(-1, 2)
+        indices = np.arange(self.n_satellite_station, self.n_satellite_station + len(coordinates))
+        self.satellite_stations_connection_coordinates.extend(tuple(c) for c in coordinates.tolist())
+        self.satellite_stations_coordinates_array = np.concatenate((self.satellite_stations_coordinates_array, coordinates))
+        self.n_satellite_station += len(coordinates)
+        if self.connection_cost_matrix is not None:
+            # new columns appended to a copy : the matrix may be a read-only memory map of the cache
+            new_costs = self.coordinates_to_cost_matrix(self.main_stations_coordinates_array, coordinates)
+            self.connection_cost_matrix = np.concatenate((self.connection_cost_matrix, new_costs), axis=1)
+        else:
+            candidate_mains, candidate_costs = self._candidate_lists(coordinates, self.candidate_mains.shape[1])
+            self.candidate_mains = np.concatenate((self.candidate_mains, candidate_mains))
+            self.candidate_costs = np.concatenate((self.candidate_costs, candidate_costs))
+            self._build_reverse_candidate_lists()
+        self._cost_model_updated()
+        return indices
+
+    def remove_satellite_stations(self, satellite_stations) -> None:
+        """Remove satellite stations from the instance, the remaining ones are renumbered in the same order
+
+        Args:
+            satellite_stations (array-like): indices of the satellite stations to remove
+        """
+        keep = np.ones(self.n_satellite_station, dtype=bool)
+        keep[np.asarray(satellite_stations, dtype=np.intp)] = False
+        self.satellite_stations_connection_coordinates = [c for c, kept in zip(self.satellite_stations_connection_coordinates, keep) if kept]
+        self.satellite_stations_coordinates_array = self.satellite_stations_coordinates_array[keep]
+        self.n_satellite_station = int(keep.sum())
+        if self.connection_cost_matrix is not None:
+            self.connection_cost_matrix = np.ascontiguousarray(self.connection_cost_matrix[:, keep])
+        else:
+            self.candidate_mains = self.candidate_mains[keep]
+            self.candidate_costs = self.candidate_costs[keep]
+            self._build_reverse_candidate_lists()
+        self._cost_model_updated()
+
+    def set_opening_costs(self, main_stations, opening_costs) -> None:
+        """Change the opening cost of some main stations (a finite cost allows a forbidden station again)
+
+        Args:
+            main_stations (array-like): indices of the main stations
+            opening_costs (array-like | float): their new opening costs
+        """
+        main_stations = np.atleast_1d(np.asarray(main_stations, dtype=np.intp))
+        opening_costs = np.broadcast_to(np.asarray(opening_costs, dtype=np.float64), main_stations.shape)
+        opening_cost_array = self.main_stations_opening_cost_array.copy()
+        opening_cost_array[main_stations] = opening_costs
+        if np.isinf(opening_cost_array).all():
+            raise ValueError("At least one main station must stay allowed")
+        self.main_stations_opening_cost_array = opening_cost_array
+        for main_station, opening_cost in zip(main_stations.tolist(), opening_costs.tolist()):
+            self.main_stations_opening_cost[main_station] = opening_cost
+        self._cost_model_updated()
+
+    def forbid_main_stations(self, main_stations) -> None:
+        """Forbid the opening of some main stations (e.g. a closed site) : their opening cost becomes infinite
+
+        Args:
+            main_stations (array-like): indices of the main stations
+        """
+        self.set_opening_costs(main_stations, math.inf)
+
+    def _cost_model_updated(self) -> None:
+        """Drop what was computed from the previous cost model"""
+        self._connection_cost_lists = None
+        if getattr(self, "evaluation_cache", None) is not None:
+            self.evaluation_cache.clear()
+
     def get_opening_cost(self,main_stations: int) -> float:
         """Get the opening cost of a main station
 
@@ -75,7 +408,7 @@ class UFLP():
         Returns:
             float: opening cost of the main station
         """
-        return self.main_stations_opening_cost[main_stations]
+        return float(self.main_stations_opening_cost_array[main_stations])
     
     def get_association_cost(self,main_station: int,satellite_station: int) -> float:
         """Get the association cost of a satellite station to a main station
@@ -87,43 +420,69 @@ class UFLP():
         Returns:
             float: association cost of the satellite station to the main station
         """
-        return self.satellite_stations_connection_cost[main_station][satellite_station]
+        if self.connection_cost_matrix is None:
+            return self.coordinates_to_cost(*self.main_stations_coordinates_array[main_station], *self.satellite_stations_coordinates_array[satellite_station])
+        return float(self.connection_cost_matrix[main_station, satellite_station])
     
-    def show_solution(self,main_stations_opened: List[int], satellite_stations_association: list[int]) -> None:
-        """Show the solution on a plot
+    def show_solution(self, main_stations_opened: List[int], satellite_stations_association: list[int], filename: str = None,
+                      show: bool = True, labels: bool = None, max_labels: int = 100, dpi: int = 100) -> None:
+        """Show the solution on a plot and save it as a PNG image
+
+        Each kind of station is drawn with a single scatter call and the assignments with a single LineCollection,
+        so instances of thousands of stations are rendered in seconds. With show=False the figure is drawn by the
+        Agg backend without pyplot : no display is needed (batch jobs, servers).
 
         Args:
             main_stations_opened (List[int]): list of 0/1, 1 if the main station is opened, 0 otherwise
             satellite_stations_associations (list[int]): list of the main station associated to each satellite station
+            filename (str): path of the image, instances/<instance_name>.png by default
+            show (bool): open the plot in a window once saved
+            labels (bool): write the opening costs and the connection costs (by default only when there are at most
+                max_labels stations of each kind)
+            max_labels (int): maximum number of labels of each kind, one station out of n is labelled beyond
+            dpi (int): resolution of the image
         """
-        plt.figure(figsize=(10, 7))
+        from matplotlib.collections import LineCollection
+        if show:
+            import matplotlib.pyplot as plt
+            figure = plt.figure(figsize=(10, 7))
+        else:
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            from matplotlib.figure import Figure
+            figure = Figure(figsize=(10, 7))
+            FigureCanvasAgg(figure)
+        axes = figure.add_subplot()
+        main_stations_opened = np.asarray(main_stations_opened).astype(bool)
+        satellite_stations_association = np.asarray(satellite_stations_association, dtype=np.intp)
+        main_coordinates = self.main_stations_coordinates_array
+        satellite_coordinates = self.satellite_stations_coordinates_array
+        # one segment (main station, satellite station) per assignment
+        segments = np.stack((main_coordinates[satellite_stations_association], satellite_coordinates), axis=1)
+        # smaller markers and lines when there are many stations
+        marker_size = min(36.0, 36000.0 / max(self.n_main_station + self.n_satellite_station, 1))
+        axes.add_collection(LineCollection(segments, colors='black', linewidths=min(1.0, marker_size / 18), zorder=1))
+        axes.scatter(satellite_coordinates[:, 0], satellite_coordinates[:, 1], s=marker_size, marker='o', color='blue', label='Gares satellites', zorder=2)
+        axes.scatter(main_coordinates[~main_stations_opened, 0], main_coordinates[~main_stations_opened, 1], s=marker_size, marker='s', color='red',
+                     label='Gares principales (closed)', zorder=3)
+        axes.scatter(main_coordinates[main_stations_opened, 0], main_coordinates[main_stations_opened, 1], s=max(4 * marker_size, 60.0), marker='o', color='red', edgecolors='black',
+                     label='Gares principales', zorder=3)
 
+        if labels is None:
+            labels = self.n_main_station <= max_labels and self.n_satellite_station <= max_labels
+        if labels:
+            for i in range(0, self.n_main_station, max(1, -(-self.n_main_station // max_labels))):
+                axes.text(main_coordinates[i, 0], main_coordinates[i, 1], str(round(float(self.main_stations_opening_cost_array[i]),2)), color='red')
+            association_costs = self.get_association_costs(satellite_stations_association)
+            middles = segments.mean(axis=1)
+            for j in range(0, self.n_satellite_station, max(1, -(-self.n_satellite_station // max_labels))):
+                axes.text(middles[j, 0], middles[j, 1], str(round(float(association_costs[j]),2)), color='black')
 
-        for i in range(self.n_main_station):
-            plt.text(self.main_stations_coordinates[i][0], self.main_stations_coordinates[i][1], str(round(self.main_stations_opening_cost[i],2)), color='red')
-            if main_stations_opened[i]:
-                plt.scatter(self.main_stations_coordinates[i][0], self.main_stations_coordinates[i][1], marker='o', color='red', label=f'Gare principale {i+1}')
-            else:
-                plt.scatter(self.main_stations_coordinates[i][0], self.main_stations_coordinates[i][1], marker='s', color='red', label=f'Gare principale {i+1} (closed)')
-        for j in range(self.n_satellite_station):
-            plt.scatter(self.satellite_stations_connection_coordinates[j][0], self.satellite_stations_connection_coordinates[j][1], marker='o', color='blue', label=f'Gare satellite {j+1}')
-        for i in range(self.n_satellite_station):
-            for j in range(self.n_main_station):
-                if satellite_stations_association[i] == j:
-
-                    plt.plot([self.main_stations_coordinates[j][0], self.satellite_stations_connection_coordinates[i][0]], [self.main_stations_coordinates[j][1], self.satellite_stations_connection_coordinates[i][1]], color='black')
-                    plt.text((self.main_stations_coordinates[j][0] + self.satellite_stations_connection_coordinates[i][0]) / 2, (self.main_stations_coordinates[j][1] + self.satellite_stations_connection_coordinates[i][1]) / 2, str(round(self.satellite_stations_connection_cost[j][i],2)), color='black')
-                # pour afficher les couts de connexion des gares satellites aux gares principales
-                """else:
-                    plt.plot([self.main_stations_coordinates[j][0], self.satellite_stations_connection_coordinates[i][0]], [self.main_stations_coordinates[j][1], self.satellite_stations_connection_coordinates[i][1]], color='gray', linestyle='dashed')
-                    plt.text((self.main_stations_coordinates[j][0] + self.satellite_stations_connection_coordinates[i][0]) / 2, (self.main_stations_coordinates[j][1] + self.satellite_stations_connection_coordinates[i][1]) / 2, str(round(self.satellite_stations_connection_cost[j][i],2)), color='gray')"""
-
-        plt.title(f'Instance {self.instance_name}')
-        plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left', borderaxespad=0.)
-        plt.subplots_adjust(right=0.65)
-        plt.savefig(f'instances/{self.instance_name}.png')
-        plt.show()
-
+        axes.set_title(f'Instance {self.instance_name}')
+        axes.legend(bbox_to_anchor=(1.05, 1), loc='upper left', borderaxespad=0.)
+        figure.subplots_adjust(right=0.7)
+        figure.savefig(filename or f'instances/{self.instance_name}.png', dpi=dpi)
+        if show:
+            plt.show()
 
     def solution_checker(self, main_stations_opened: List[int], satellite_stations_association: list[int]):
         """Check if a solution is valid
@@ -157,6 +516,9 @@ class UFLP():
             if not main_stations_opened[main_station]:
                 print("Wrong solution: assignation to a closed station")
                 return False
+            if math.isinf(self.main_stations_opening_cost_array[main_station]):
+                print("Wrong solution: assignation to a forbidden station")
+                return False
 
         for state in main_stations_opened:
 